@@ -0,0 +1,138 @@
+"""
+Общее хранилище промежуточных данных для задач DAG.
+
+Таблицы пишутся в Parquet (схема и типы колонок сохраняются, читать можно
+только нужные колонки, файл открывается через memory map), объекты вроде
+модели и скейлера — в pickle. Рядом с каждым артефактом лежит хэш его
+содержимого, а у каждого этапа — манифест с отпечатком входов и хэшами
+файлов выходов: если входы и параметры не изменились, а файлы выходов те
+же, что записал этап, этап можно пропустить.
+
+Каждый DAG работает в своём подкаталоге PIPELINE_STORAGE_DIR:
+    storage = Storage("ml_regression")
+"""
+import hashlib
+import json
+import os
+import pickle
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORAGE_DIR = os.getenv("PIPELINE_STORAGE_DIR", "/tmp/pipeline_storage")
+
+
+def _atomic_write(path: str, write):
+    """Пишет во временный файл и переименовывает: читатель не увидит половину файла."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_bytes(path: str, data: bytes):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    _atomic_write(path, write)
+
+
+def table_digest(df: pd.DataFrame) -> str:
+    """Хэш таблицы по значениям, именам и типам колонок (не зависит от формата файла)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+class Storage:
+    """Артефакты и манифесты этапов одного DAG в каталоге STORAGE_DIR/<subdir>."""
+
+    def __init__(self, subdir: str):
+        self.directory = os.path.join(STORAGE_DIR, subdir)
+
+    def _path(self, name: str, suffix: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{name}{suffix}")
+
+    def _save_digest(self, name: str, content_digest: str):
+        _write_bytes(self._path(name, ".sha256"), content_digest.encode())
+
+    def digest(self, name: str) -> Optional[str]:
+        """Хэш содержимого артефакта или None, если его ещё нет."""
+        try:
+            with open(self._path(name, ".sha256")) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def write_table(self, name: str, df: pd.DataFrame) -> str:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        _atomic_write(self._path(name, ".parquet"), lambda p: pq.write_table(table, p))
+        content_digest = table_digest(df)
+        self._save_digest(name, content_digest)
+        return content_digest
+
+    def read_table(self, name: str, columns: Optional[List[str]] = None, filters=None) -> pd.DataFrame:
+        """Читает таблицу целиком или только колонки columns и строки, подходящие под filters (синтаксис pyarrow)."""
+        return pq.read_table(self._path(name, ".parquet"), columns=columns, filters=filters, memory_map=True).to_pandas()
+
+    def table_columns(self, name: str) -> List[str]:
+        """Имена колонок из схемы файла, без чтения данных."""
+        return pq.read_schema(self._path(name, ".parquet")).names
+
+    def write_object(self, name: str, obj) -> str:
+        data = pickle.dumps(obj)
+        _write_bytes(self._path(name, ".pkl"), data)
+        content_digest = hashlib.sha256(data).hexdigest()
+        self._save_digest(name, content_digest)
+        return content_digest
+
+    def read_object(self, name: str):
+        with open(self._path(name, ".pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def fingerprint(self, inputs: List[str], **params) -> str:
+        """Отпечаток этапа: хэши входных артефактов плюс параметры."""
+        payload = {"inputs": {name: self.digest(name) for name in inputs}, "params": params}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _file_digest(self, name: str) -> Optional[str]:
+        """Хэш байтов файла артефакта (Parquet или pickle) или None, если файла нет."""
+        for suffix in (".parquet", ".pkl"):
+            h = hashlib.sha256()
+            try:
+                with open(self._path(name, suffix), "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        h.update(block)
+            except FileNotFoundError:
+                continue
+            return h.hexdigest()
+        return None
+
+    def is_up_to_date(self, stage: str, stage_fingerprint: str) -> bool:
+        """
+        True, если этап уже выполнялся с тем же отпечатком, а файлы его выходов
+        побайтно те же, что он записал: перезаписанный или испорченный файл
+        делает этап устаревшим.
+        """
+        try:
+            with open(self._path(stage, ".stage.json")) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        if manifest.get("fingerprint") != stage_fingerprint:
+            return False
+        return all(
+            isinstance(output, dict) and self.digest(name) == output.get("digest")
+            and self._file_digest(name) == output.get("file_digest")
+            for name, output in manifest.get("outputs", {}).items()
+        )
+
+    def mark_done(self, stage: str, stage_fingerprint: str, outputs: List[str]):
+        manifest = {
+            "fingerprint": stage_fingerprint,
+            "outputs": {name: {"digest": self.digest(name), "file_digest": self._file_digest(name)} for name in outputs},
+        }
+        _write_bytes(self._path(stage, ".stage.json"), json.dumps(manifest).encode())
@@ -0,0 +1,173 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pendulum
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import TimeSeriesSplit, cross_val_score
+from sqlalchemy import create_engine, text
+from airflow.models.dag import DAG
+from airflow.operators.python import PythonOperator
+
+from pipeline_storage import Storage
+
+storage = Storage("popularity_forecast")
+
+# Основная БД с сущностями и их статистикой (сервис db в docker-compose)
+ENTITY_DB_URI = os.getenv("ENTITY_DB_URI", "postgresql+psycopg2://example:example@db:5432/example")
+STATS_TABLE = os.getenv("ENTITY_STATS_TABLE", "entity_statistics")
+PREDICTIONS_TABLE = os.getenv("PREDICTIONS_TABLE", "predictions")
+HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", 180))
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+PARTITION_SIZE = int(os.getenv("FORECAST_PARTITION_SIZE", 200))
+
+LAGS = 7        # прогноз на следующий день по 7 предыдущим
+CV_FOLDS = 5
+MIN_SAMPLES = 2 * CV_FOLDS
+FORECAST_COLUMNS = (['entity_id', 'intercept'] + [f'coef_{i}' for i in range(LAGS)]
+                    + ['cv_mae', 'trained_until', 'prediction_date', 'predicted_popularity'])
+
+def daily_counts(group):
+    """Дневной ряд сущности без пропусков: дни без упоминаний — нули."""
+    return group.set_index('day')['count'].sort_index().asfreq('D', fill_value=0)
+
+def lag_features(counts):
+    values = counts.to_numpy(dtype=np.float64)
+    X = np.lib.stride_tricks.sliding_window_view(values[:-1], LAGS)
+    y = values[LAGS:]
+    return X, y
+
+def fit_partition(entity_ids, cv_jobs):
+    """
+    Обучает модели для части сущностей. Выполняется в отдельном процессе:
+    читает из общего хранилища только строки своих сущностей.
+    """
+    series = storage.read_table('entity_series', filters=[('entity_id', 'in', entity_ids)])
+    rows = []
+    for entity_id, group in series.groupby('entity_id'):
+        counts = daily_counts(group)
+        if len(counts) <= LAGS + MIN_SAMPLES:
+            continue
+        X, y = lag_features(counts)
+
+        # Фолды по времени: валидация всегда позже обучения
+        model = LinearRegression()
+        cv_scores = cross_val_score(model, X, y, cv=TimeSeriesSplit(n_splits=CV_FOLDS),
+                                    scoring='neg_mean_absolute_error', n_jobs=cv_jobs)
+        model.fit(X, y)
+        forecast = model.predict(counts.to_numpy(dtype=np.float64)[-LAGS:].reshape(1, -1))[0]
+
+        row = {'entity_id': entity_id, 'intercept': float(model.intercept_)}
+        row.update({f'coef_{i}': float(c) for i, c in enumerate(model.coef_)})
+        row.update({
+            'cv_mae': float(-cv_scores.mean()),
+            'trained_until': counts.index[-1],
+            'prediction_date': counts.index[-1] + pd.Timedelta(days=1),
+            'predicted_popularity': max(float(forecast), 0.0),
+        })
+        rows.append(row)
+    return rows
+
+def extract_statistics():
+    """Выгружает дневные ряды только тех сущностей, по которым появились новые данные."""
+    engine = create_engine(ENTITY_DB_URI)
+    latest = pd.read_sql(text(f"SELECT entity_id, max(datetime) AS last_datetime FROM {STATS_TABLE} GROUP BY entity_id"), engine)
+
+    if storage.digest('forecast_state') is not None:
+        state = storage.read_table('forecast_state')
+        latest = latest.merge(state, on='entity_id', how='left', suffixes=('', '_trained'))
+        changed = latest[latest['last_datetime_trained'].isna() | (latest['last_datetime'] > latest['last_datetime_trained'])]
+        changed = changed[['entity_id', 'last_datetime']]
+    else:
+        changed = latest
+    print(f"Entities with new data: {len(changed)} of {len(latest)}")
+
+    since = pd.Timestamp.now(tz='UTC').normalize() - pd.Timedelta(days=HISTORY_DAYS)
+    series = pd.read_sql(
+        text(f"SELECT entity_id, date_trunc('day', datetime) AS day, sum(count) AS count "
+             f"FROM {STATS_TABLE} WHERE entity_id = ANY(:ids) AND datetime >= :since "
+             f"GROUP BY 1, 2 ORDER BY 1, 2"),
+        engine, params={'ids': changed['entity_id'].tolist(), 'since': since.to_pydatetime()},
+    )
+    series['day'] = pd.to_datetime(series['day']).dt.tz_localize(None)
+    series['count'] = series['count'].astype(np.int64)
+
+    storage.write_table('entity_series', series)
+    storage.write_table('pending_state', changed.reset_index(drop=True))
+
+def train_forecasters():
+    stage_fingerprint = storage.fingerprint(['entity_series'], lags=LAGS, cv_folds=CV_FOLDS)
+    if storage.is_up_to_date('train_forecasters', stage_fingerprint):
+        print("Forecasters are up to date, skipping")
+        return
+
+    entity_ids = storage.read_table('entity_series', columns=['entity_id'])['entity_id'].unique().tolist()
+    partitions = [entity_ids[i:i + PARTITION_SIZE] for i in range(0, len(entity_ids), PARTITION_SIZE)]
+
+    # Ядра, не занятые сущностями (их меньше, чем процессов), отдаём под фолды кросс-валидации
+    workers = max(min(FORECAST_WORKERS, len(partitions)), 1)
+    cv_jobs = max(FORECAST_WORKERS // workers, 1)
+    print(f"Training {len(entity_ids)} entities in {len(partitions)} partitions: {workers} processes, {cv_jobs} CV jobs each")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for partition_rows in pool.map(fit_partition, partitions, [cv_jobs] * len(partitions)):
+            rows.extend(partition_rows)
+    trained = pd.DataFrame(rows, columns=FORECAST_COLUMNS)
+    print(f"Trained {len(trained)} forecasters")
+
+    # Модели остальных сущностей остаются как есть
+    forecasters = trained
+    if storage.digest('forecasters') is not None:
+        previous = storage.read_table('forecasters')
+        forecasters = pd.concat([previous[~previous['entity_id'].isin(trained['entity_id'])], trained], ignore_index=True)
+    storage.write_table('forecasters', forecasters)
+    storage.write_table('new_forecasts', trained)
+    storage.mark_done('train_forecasters', stage_fingerprint, ['forecasters', 'new_forecasts'])
+
+def write_predictions():
+    forecasts = storage.read_table('new_forecasts')
+    if not forecasts.empty:
+        records = forecasts[['entity_id', 'prediction_date', 'predicted_popularity']].to_dict('records')
+        engine = create_engine(ENTITY_DB_URI)
+        with engine.begin() as conn:
+            # Повторный запуск перезаписывает прогноз на ту же дату
+            conn.execute(text(f"DELETE FROM {PREDICTIONS_TABLE} WHERE entity_id = :entity_id AND prediction_date = :prediction_date"), records)
+            conn.execute(text(f"INSERT INTO {PREDICTIONS_TABLE} (entity_id, prediction_date, predicted_popularity, created_at) "
+                              f"VALUES (:entity_id, :prediction_date, :predicted_popularity, now())"), records)
+    print(f"Predictions written: {len(forecasts)}")
+
+    # Отмечаем сущности обработанными только после записи прогнозов
+    pending = storage.read_table('pending_state')
+    if storage.digest('forecast_state') is not None:
+        state = storage.read_table('forecast_state')
+        pending = pd.concat([state[~state['entity_id'].isin(pending['entity_id'])], pending], ignore_index=True)
+    storage.write_table('forecast_state', pending)
+
+dag = DAG(
+    'popularity_forecast',
+    start_date=pendulum.datetime(2024, 1, 1, tz="UTC"),
+    schedule='@daily',
+    catchup=False
+)
+
+extract = PythonOperator(
+    task_id='extract_statistics',
+    python_callable=extract_statistics,
+    dag=dag
+)
+
+train = PythonOperator(
+    task_id='train_forecasters',
+    python_callable=train_forecasters,
+    dag=dag
+)
+
+predict = PythonOperator(
+    task_id='write_predictions',
+    python_callable=write_predictions,
+    dag=dag
+)
+
+extract >> train >> predict
@@ -1,7 +1,6 @@
 import pandas as pd
 import pendulum
 import time
-import pickle
 from sklearn.datasets import make_regression
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split, cross_val_score
@@ -10,18 +9,35 @@ from sklearn import metrics
 from airflow.models.dag import DAG
 from airflow.operators.python import PythonOperator
 
+from pipeline_storage import Storage
+
+storage = Storage('ml_regression')
+
+DATASET_PARAMS = {'n_samples': 1000, 'n_features': 5, 'noise': 0.1, 'random_state': 42}
+
 def create_dataset():
-    X, y = make_regression(n_samples=1000, n_features=5, noise=0.1, random_state=42)
-    df = pd.DataFrame(data=X, columns=[f'feature_{i}' for i in range(5)])
+    stage_fingerprint = storage.fingerprint([], **DATASET_PARAMS)
+    if storage.is_up_to_date('create_dataset', stage_fingerprint):
+        print("Dataset is up to date, skipping")
+        return
+
+    X, y = make_regression(**DATASET_PARAMS)
+    df = pd.DataFrame(data=X, columns=[f'feature_{i}' for i in range(DATASET_PARAMS['n_features'])])
     df['target'] = y
     print("Dataset created with shape:", df.shape)
-    df.to_csv('/tmp/regression_data.csv', index=False)
+    storage.write_table('regression_data', df)
+    storage.mark_done('create_dataset', stage_fingerprint, ['regression_data'])
 
 def preprocess_data():
+    stage_fingerprint = storage.fingerprint(['regression_data'])
+    if storage.is_up_to_date('preprocess_data', stage_fingerprint):
+        print("Preprocessed data is up to date, skipping")
+        return
+
     print("Starting data preprocessing...")
     time.sleep(5)
 
-    df = pd.read_csv('/tmp/regression_data.csv')
+    df = storage.read_table('regression_data')
 
     # Feature engineering с паузами
     print("Performing feature engineering...")
@@ -39,19 +55,24 @@ def preprocess_data():
     scaler = StandardScaler()
     df[feature_cols] = scaler.fit_transform(df[feature_cols])
 
-    df.to_csv('/tmp/preprocessed_data.csv', index=False)
+    storage.write_table('preprocessed_data', df)
 
     # Сохраняем скейлер
-    with open('/tmp/scaler.pkl', 'wb') as f:
-        pickle.dump(scaler, f)
+    storage.write_object('scaler', scaler)
+    storage.mark_done('preprocess_data', stage_fingerprint, ['preprocessed_data', 'scaler'])
 
     print("Preprocessing completed!")
 
 def train_and_validate():
+    stage_fingerprint = storage.fingerprint(['preprocessed_data'], test_size=0.2, random_state=42, cv=5)
+    if storage.is_up_to_date('train_and_validate', stage_fingerprint):
+        print("Model is up to date, skipping")
+        return
+
     print("Starting model training and validation...")
     time.sleep(5)
 
-    df = pd.read_csv('/tmp/preprocessed_data.csv')
+    df = storage.read_table('preprocessed_data')
     feature_cols = [col for col in df.columns if col != 'target']
     X = df[feature_cols]
     y = df['target']
@@ -80,22 +101,27 @@ def train_and_validate():
     print(f"Test R2: {metrics.r2_score(y_test, y_pred):.4f}")
 
     # Сохраняем модель
-    with open('/tmp/trained_model.pkl', 'wb') as f:
-        pickle.dump(model, f)
+    storage.write_object('trained_model', model)
+    storage.mark_done('train_and_validate', stage_fingerprint, ['trained_model'])
 
     time.sleep(5)
     print("Model training and validation completed!")
 
 def evaluate_model():
+    stage_fingerprint = storage.fingerprint(['trained_model', 'preprocessed_data'])
+    if storage.is_up_to_date('evaluate_model', stage_fingerprint):
+        print("Metrics are up to date, skipping")
+        return
+
     print("Starting final model evaluation...")
     time.sleep(5)
 
     # Загружаем модель
-    with open('/tmp/trained_model.pkl', 'rb') as f:
-        model = pickle.load(f)
+    model = storage.read_object('trained_model')
 
-    df = pd.read_csv('/tmp/preprocessed_data.csv')
-    feature_cols = [col for col in df.columns if col != 'target']
+    # Читаем только те колонки, на которых обучалась модель
+    feature_cols = list(model.feature_names_in_)
+    df = storage.read_table('preprocessed_data', columns=feature_cols + ['target'])
     X = df[feature_cols]
     y = df['target']
 
@@ -118,7 +144,8 @@ def evaluate_model():
 
     # Сохраняем метрики
     metrics_dict = {'mae': mae, 'mse': mse, 'r2': r2}
-    pd.Series(metrics_dict).to_csv('/tmp/model_metrics.csv')
+    storage.write_table('model_metrics', pd.DataFrame([metrics_dict]))
+    storage.mark_done('evaluate_model', stage_fingerprint, ['model_metrics'])
 
     print("Model evaluation completed!")
 
@@ -0,0 +1,113 @@
+import numpy as np
+
+from cluster_matcher import BaseClusterMatcher
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib нужен только для бэкенда hnsw
+    hnswlib = None
+
+
+class HNSWClusterMatcher(BaseClusterMatcher):
+    """
+    Приближённый поиск ближайшего кластера по графу HNSW (hnswlib).
+
+    Поддерживает инкрементальные вставки и удаления: удалённые элементы
+    помечаются в графе, а их места занимают новые кластеры. Метки не
+    переиспользуются: hnswlib сам выбирает, какое удалённое место занять,
+    и забывает его прежнюю метку, поэтому каждый кластер получает новую.
+    Параметр ef регулирует баланс между полнотой поиска и задержкой.
+    """
+
+    def __init__(self, threshold: float, dim: int | None = None, capacity: int = 1024,
+                 m: int = 16, ef_construction: int = 200, ef: int = 64):
+        if hnswlib is None:
+            raise ImportError("hnswlib is required for the hnsw matcher backend")
+        super().__init__(threshold)
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._capacity = capacity
+        self._index = None
+        self._labels = {}
+        self._ids = {}
+        self._deleted = 0
+        self._next_label = 0
+        if dim is not None:
+            self._init_index()
+
+    def _init_index(self):
+        self._index = hnswlib.Index(space="ip", dim=self.dim)
+        self._index.init_index(
+            max_elements=self._capacity, ef_construction=self.ef_construction,
+            M=self.m, allow_replace_deleted=True,
+        )
+        self._index.set_ef(self.ef)
+
+    def set_ef(self, ef: int):
+        """Меняет ef поиска: больше — выше полнота, но медленнее."""
+        self.ef = ef
+        if self._index is not None:
+            self._index.set_ef(ef)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, cluster_id):
+        return cluster_id in self._labels
+
+    def ids(self):
+        return list(self._labels)
+
+    def add(self, cluster_id: str, embedding: np.ndarray):
+        """Добавляет кластер или перезаписывает эмбеддинг существующего."""
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        if self._index is None:
+            self.dim = embedding.shape[1]
+            self._init_index()
+
+        label = self._labels.get(cluster_id)
+        if label is not None:
+            self._index.add_items(embedding, [label])
+            return
+
+        label = self._next_label
+        self._next_label += 1
+        if self._deleted:
+            # Занимает одно из удалённых мест, какое — решает hnswlib
+            self._index.add_items(embedding, [label], replace_deleted=True)
+            self._deleted -= 1
+        else:
+            if self._index.get_current_count() >= self._index.get_max_elements():
+                self._index.resize_index(self._index.get_max_elements() * 2)
+            self._index.add_items(embedding, [label])
+        self._labels[cluster_id] = label
+        self._ids[label] = cluster_id
+
+    def remove(self, cluster_id: str):
+        label = self._labels.pop(cluster_id, None)
+        if label is None:
+            return
+        del self._ids[label]
+        self._index.mark_deleted(label)
+        self._deleted += 1
+
+    def get_embedding(self, cluster_id: str):
+        label = self._labels.get(cluster_id)
+        if label is None:
+            return None
+        return np.asarray(self._index.get_items([label])[0], dtype=np.float32)
+
+    def search(self, embeddings: np.ndarray):
+        """
+        Возвращает (ids, sims) ближайшего кластера для каждой строки embeddings.
+        Если кластеров нет, id = None, а близость = -inf.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if not self._labels:
+            return [None] * len(embeddings), np.full(len(embeddings), -np.inf, dtype=np.float32)
+        labels, distances = self._index.knn_query(embeddings, k=1)
+        # Для пространства "ip" hnswlib возвращает 1 - <a, b>
+        sims = 1.0 - distances[:, 0]
+        return [self._ids[label] for label in labels[:, 0]], sims.astype(np.float32)
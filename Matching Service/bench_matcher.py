@@ -0,0 +1,85 @@
+"""
+Бенчмарк бэкендов матчинга: точный поиск по матрице против HNSW.
+
+Строит синтетические нормализованные эмбеддинги вокруг случайных центров,
+наполняет оба индекса и сравнивает время построения, задержку поиска пачки
+и полноту (recall@1) HNSW относительно точного поиска.
+
+Пример:
+    python bench_matcher.py --sizes 10000,100000,1000000 --dim 1024 --ef 32,64,128
+"""
+import argparse
+import time
+
+import numpy as np
+
+from cluster_matcher import get_matcher_class
+
+
+def normalize(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_data(n_clusters, n_queries, dim, rng):
+    centroids = normalize(rng.standard_normal((n_clusters, dim), dtype=np.float32))
+    picked = rng.integers(0, n_clusters, n_queries)
+    noise = rng.standard_normal((n_queries, dim), dtype=np.float32) * (0.5 / np.sqrt(dim))
+    return centroids, normalize(centroids[picked] + noise)
+
+
+def build(backend, centroids, **options):
+    matcher = get_matcher_class(backend)(0.8, capacity=len(centroids), **options)
+    started = time.perf_counter()
+    for i, emb in enumerate(centroids):
+        matcher.add(str(i), emb)
+    return matcher, time.perf_counter() - started
+
+
+def time_search(matcher, queries, batch, repeats):
+    latencies = []
+    for _ in range(repeats):
+        for start in range(0, len(queries), batch):
+            chunk = queries[start:start + batch]
+            t0 = time.perf_counter()
+            ids, _ = matcher.search(chunk)
+            latencies.append(time.perf_counter() - t0)
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--ef", default="32,64,128")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'clusters':>9} {'backend':>12} {'build, s':>9} {'p50, ms':>9} {'p99, ms':>9} {'recall@1':>9}")
+    for size in map(int, args.sizes.split(",")):
+        centroids, queries = make_data(size, args.queries, args.dim, rng)
+
+        exact, build_time = build("exact", centroids)
+        truth, _ = exact.search(queries)
+        p50, p99 = time_search(exact, queries, args.batch, args.repeats)
+        print(f"{size:>9} {'exact':>12} {build_time:>9.2f} {p50:>9.2f} {p99:>9.2f} {1.0:>9.3f}")
+        del exact
+
+        hnsw, build_time = build("hnsw", centroids, m=args.m, ef_construction=args.ef_construction)
+        for ef in map(int, args.ef.split(",")):
+            hnsw.set_ef(ef)
+            found, _ = hnsw.search(queries)
+            recall = np.mean([a == b for a, b in zip(found, truth)])
+            p50, p99 = time_search(hnsw, queries, args.batch, args.repeats)
+            print(f"{size:>9} {f'hnsw ef={ef}':>12} {build_time:>9.2f} {p50:>9.2f} {p99:>9.2f} {recall:>9.3f}")
+        del hnsw
+
+
+if __name__ == "__main__":
+    main()
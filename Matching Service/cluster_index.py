@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+
+from cluster_matcher import get_matcher_class
+from cluster_snapshot import read_snapshot, write_snapshot
+
+
+class ClusterIndex:
+    """
+    Резидентный индекс кластеров сервиса.
+
+    Загружается из Redis один раз и дальше обновляется инкрементально при
+    сохранении и удалении кластеров. Согласованность между репликами
+    держится на счётчике версии в Redis: каждая реплика увеличивает его
+    после своих изменений и пишет в журнал, какие кластеры добавила и
+    удалила. Если версия ушла дальше, чем мы ожидали, значит писал кто-то
+    ещё — тогда применяются записи журнала, а индекс перечитывается
+    целиком, только если нужных записей в журнале уже нет.
+    Сдвиг центроидов версию не меняет: центроиды, обновлённые другими
+    репликами, подтягиваются при следующей полной загрузке.
+
+    Индекс можно сохранить в файл-снимок и при старте восстановить из него
+    вместо полного чтения Redis, если с момента снимка кластеры не менялись.
+    """
+
+    def __init__(self, redis_helper, threshold: float, cluster_prefix: str, embed_prefix: str, version_key: str,
+                 backend: str = "exact", matcher_options: dict | None = None,
+                 changes_key: str = "clusters:changes", changes_maxlen: int = 10_000):
+        self.redis_helper = redis_helper
+        self.threshold = threshold
+        self.matcher_class = get_matcher_class(backend)
+        self.matcher_options = matcher_options or {}
+        self.cluster_prefix = cluster_prefix
+        self.embed_prefix = embed_prefix
+        self.version_key = version_key
+        self.changes_key = changes_key
+        self.changes_maxlen = changes_maxlen
+        self.matcher = self.matcher_class(threshold, **self.matcher_options)
+        self.version = None
+        # Есть изменения, не попавшие в снимок
+        self.dirty = False
+
+    def load(self):
+        """Полностью перечитывает кластеры из Redis."""
+        # Версию читаем до загрузки: изменения, сделанные во время
+        # загрузки, приведут к повторному чтению при следующем sync()
+        version = self.redis_helper.get_version(self.version_key)
+        clusters = self.redis_helper.get_all_stored_clusters(self.cluster_prefix, self.embed_prefix, with_members=False)
+        self.matcher = self.matcher_class.from_clusters(clusters, self.threshold, **self.matcher_options)
+        self.version = version
+        self.dirty = True
+        print(f"✅ Cluster index loaded: {len(self.matcher)} clusters, version {version}")
+
+    def sync(self):
+        """Подтягивает изменения других писателей из журнала или, если его не хватает, перечитывает индекс."""
+        version = self.redis_helper.get_version(self.version_key)
+        if version == self.version:
+            return
+        if self.version is None or version < self.version or not self.apply_changes(version):
+            self.load()
+
+    def apply_changes(self, version: int) -> bool:
+        """
+        Применяет записи журнала для версий после self.version до version.
+        Возвращает False, если журнал уже обрезан и записей не хватает.
+        """
+        changes = self.redis_helper.get_changes(self.changes_key, self.version, version)
+        if [change[0] for change in changes] != list(range(self.version + 1, version + 1)):
+            return False
+        added, removed = set(), set()
+        for _, change_added, change_removed in changes:
+            added.difference_update(change_removed)
+            removed.update(change_removed)
+            removed.difference_update(change_added)
+            added.update(change_added)
+        embeddings = self.redis_helper.get_cluster_embeddings(added, self.embed_prefix)
+        # Кластер без центроида уже вытеснен версией новее прочитанной
+        for cluster_id in removed | (added - embeddings.keys()):
+            self.matcher.remove(cluster_id)
+        for cluster_id, embedding in embeddings.items():
+            self.matcher.add(cluster_id, embedding)
+        self.version = version
+        self.dirty = True
+        return True
+
+    def restore(self, path: str) -> bool:
+        """
+        Восстанавливает индекс из снимка, если он совпадает с Redis по версии
+        и числу кластеров. Иначе индекс не меняется и возвращается False.
+        Повреждённый снимок откладывается в path.corrupt, чтобы следующий
+        снимок записался заново, а не падал старт сервиса.
+        """
+        try:
+            snapshot = read_snapshot(path)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            print(f"❌ Cluster snapshot {path} is corrupt, moved to {path}.corrupt: {e}")
+            try:
+                os.replace(path, f"{path}.corrupt")
+            except OSError:
+                pass
+            return False
+        if snapshot is None:
+            return False
+        meta, ids, matrix = snapshot
+        version = self.redis_helper.get_version(self.version_key)
+        count = self.redis_helper.count_clusters()
+        if meta.get("version") != version or len(ids) != count:
+            print(f"❌ Cluster snapshot is stale: version {meta.get('version')}, {len(ids)} clusters "
+                  f"vs version {version}, {count} clusters in Redis")
+            return False
+        self.matcher = self.matcher_class.from_matrix(ids, matrix, self.threshold, **self.matcher_options)
+        self.version = version
+        self.dirty = False
+        print(f"✅ Cluster index restored from snapshot: {len(ids)} clusters, version {version}")
+        return True
+
+    def save(self, path: str, lock) -> bool:
+        """
+        Пишет снимок, если с прошлого снимка индекс менялся. Под lock
+        снимается только копия матрицы, запись на диск идёт без блокировки.
+        """
+        with lock:
+            if not self.dirty or self.version is None:
+                return False
+            ids, matrix = self.matcher.export()
+            meta = {"version": self.version}
+            self.dirty = False
+        try:
+            write_snapshot(path, ids, matrix, meta)
+        except Exception:
+            self.dirty = True
+            raise
+        return True
+
+    def remove(self, cluster_ids):
+        for cluster_id in cluster_ids:
+            self.matcher.remove(cluster_id)
+        self.dirty = True
+
+    def update_centroids(self, centroids: dict):
+        """Заменяет эмбеддинги кластеров на нормализованные центроиды."""
+        for cluster_id, centroid in centroids.items():
+            self.matcher.add(cluster_id, centroid / (np.linalg.norm(centroid) or 1.0))
+        self.dirty = True
+
+    def commit(self, added=(), removed=()):
+        """Публикует наши изменения: увеличивает версию в Redis и пишет их в журнал."""
+        version = self.redis_helper.commit_changes(self.version_key, self.changes_key, added, removed,
+                                                   self.changes_maxlen)
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+        # Иначе между нашими операциями писал кто-то ещё: версию не трогаем,
+        # и следующий sync() применит журнал, включая нашу запись
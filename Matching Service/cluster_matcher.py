@@ -0,0 +1,199 @@
+import numpy as np
+
+
+class BaseClusterMatcher:
+    """
+    Общая логика сопоставления сущностей с кластерами.
+
+    Наследники реализуют хранение эмбеддингов и поиск ближайшего
+    кластера (search), а сопоставление пачки с учётом кластеров,
+    созданных внутри неё, одинаково для всех бэкендов.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+
+    @classmethod
+    def from_clusters(cls, clusters: dict, threshold: float, **kwargs):
+        """Строит матчер из словаря {cluster_id: {"embedding": ...}}."""
+        kwargs.setdefault("capacity", max(len(clusters), 1024))
+        matcher = cls(threshold, **kwargs)
+        for cluster_id, data in clusters.items():
+            matcher.add(cluster_id, data["embedding"])
+        return matcher
+
+    @classmethod
+    def from_matrix(cls, ids: list[str], matrix: np.ndarray, threshold: float, **kwargs):
+        """Строит матчер из списка id и матрицы их эмбеддингов (строка на кластер)."""
+        kwargs.setdefault("capacity", max(len(ids), 1024))
+        matcher = cls(threshold, **kwargs)
+        for cluster_id, embedding in zip(ids, matrix):
+            matcher.add(cluster_id, embedding)
+        return matcher
+
+    def export(self):
+        """Копия содержимого: (ids, матрица эмбеддингов в том же порядке)."""
+        ids = self.ids()
+        if not ids:
+            return ids, np.empty((0, self.dim or 0), dtype=np.float32)
+        return ids, np.stack([self.get_embedding(cluster_id) for cluster_id in ids]).astype(np.float32)
+
+    def add(self, cluster_id: str, embedding: np.ndarray):
+        raise NotImplementedError
+
+    def remove(self, cluster_id: str):
+        raise NotImplementedError
+
+    def search(self, embeddings: np.ndarray):
+        raise NotImplementedError
+
+    def best(self, embedding: np.ndarray):
+        """Лучший кластер с близостью не ниже порога или None."""
+        ids, sims = self.search(np.asarray(embedding).reshape(1, -1))
+        return ids[0] if sims[0] >= self.threshold else None
+
+    def match_batch(self, embeddings: np.ndarray, new_cluster_id):
+        """
+        Сопоставляет пачку эмбеддингов с кластерами.
+
+        Все сущности ищутся среди уже известных кластеров одним вызовом
+        search. Кластеры, созданные внутри пачки, хранятся отдельно и
+        видны следующим сущностям той же пачки, как при поэлементной обработке.
+        new_cluster_id(i) возвращает id для i-й сущности, если кластер не найден.
+        Возвращает список пар (cluster_id, created).
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        best_ids, best_sims = self.search(embeddings)
+
+        fresh_ids = []
+        fresh = np.empty((len(embeddings), embeddings.shape[1]), dtype=np.float32)
+        assignments = []
+        for i, emb in enumerate(embeddings):
+            cluster_id, sim = best_ids[i], best_sims[i]
+            if fresh_ids:
+                fresh_sims = fresh[:len(fresh_ids)] @ emb
+                j = int(fresh_sims.argmax())
+                if fresh_sims[j] >= self.threshold and fresh_sims[j] > sim:
+                    cluster_id, sim = fresh_ids[j], fresh_sims[j]
+
+            if sim >= self.threshold:
+                assignments.append((cluster_id, False))
+                continue
+
+            cluster_id = new_cluster_id(i)
+            self.add(cluster_id, emb)
+            fresh[len(fresh_ids)] = emb
+            fresh_ids.append(cluster_id)
+            assignments.append((cluster_id, True))
+        return assignments
+
+
+class ClusterMatcher(BaseClusterMatcher):
+    """
+    Точный поиск ближайшего кластера по матрице центроидов.
+
+    Все эмбеддинги кластеров лежат в одной непрерывной float32-матрице,
+    строки которой соответствуют self._ids. Эмбеддинги L2-нормализованы,
+    поэтому косинусная близость — это просто скалярное произведение.
+    """
+
+    def __init__(self, threshold: float, dim: int | None = None, capacity: int = 1024):
+        super().__init__(threshold)
+        self.dim = dim
+        self._capacity = capacity
+        self._matrix = None if dim is None else np.empty((capacity, dim), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, cluster_id):
+        return cluster_id in self._rows
+
+    def ids(self):
+        return list(self._ids)
+
+    @classmethod
+    def from_matrix(cls, ids: list[str], matrix: np.ndarray, threshold: float, **kwargs):
+        """
+        Использует matrix как есть, без копирования: отображённая в память
+        матрица снимка копируется только при росте или изменении строк.
+        """
+        matcher = cls(threshold, **kwargs)
+        if ids:
+            matcher.dim = matrix.shape[1]
+            matcher._matrix = matrix
+            matcher._ids = list(ids)
+            matcher._rows = {cluster_id: row for row, cluster_id in enumerate(ids)}
+        return matcher
+
+    def export(self):
+        n = len(self._ids)
+        if self._matrix is None:
+            return [], np.empty((0, self.dim or 0), dtype=np.float32)
+        return list(self._ids), self._matrix[:n].copy()
+
+    def _ensure_capacity(self, size: int):
+        if self._matrix is None:
+            self._matrix = np.empty((max(self._capacity, size), self.dim), dtype=np.float32)
+            return
+        if size <= self._matrix.shape[0]:
+            return
+        new_capacity = max(size, self._matrix.shape[0] * 2)
+        grown = np.empty((new_capacity, self.dim), dtype=np.float32)
+        grown[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = grown
+
+    def add(self, cluster_id: str, embedding: np.ndarray):
+        """Добавляет кластер или перезаписывает эмбеддинг существующего."""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        if self.dim is None:
+            self.dim = embedding.shape[0]
+        row = self._rows.get(cluster_id)
+        if row is None:
+            row = len(self._ids)
+            self._ensure_capacity(row + 1)
+            self._ids.append(cluster_id)
+            self._rows[cluster_id] = row
+        self._matrix[row] = embedding
+
+    def remove(self, cluster_id: str):
+        """Удаляет кластер, переставляя последнюю строку на его место."""
+        row = self._rows.pop(cluster_id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+
+    def get_embedding(self, cluster_id: str):
+        row = self._rows.get(cluster_id)
+        return None if row is None else self._matrix[row].copy()
+
+    def search(self, embeddings: np.ndarray):
+        """
+        Возвращает (ids, sims) лучшего кластера для каждой строки embeddings.
+        Если кластеров нет, id = None, а близость = -inf.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if not self._ids:
+            return [None] * len(embeddings), np.full(len(embeddings), -np.inf, dtype=np.float32)
+        scores = embeddings @ self._matrix[:len(self._ids)].T
+        best_rows = scores.argmax(axis=1)
+        best_sims = scores[np.arange(len(embeddings)), best_rows]
+        return [self._ids[row] for row in best_rows], best_sims
+
+
+def get_matcher_class(backend: str):
+    """Возвращает класс матчера по имени бэкенда: exact или hnsw."""
+    if backend == "exact":
+        return ClusterMatcher
+    if backend == "hnsw":
+        from ann_matcher import HNSWClusterMatcher
+        return HNSWClusterMatcher
+    raise ValueError(f"Unknown matcher backend: {backend}")
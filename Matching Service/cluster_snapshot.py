@@ -0,0 +1,68 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+# Файл снимка: MAGIC, длина заголовка (uint64 LE), заголовок JSON с метаданными
+# и id кластеров, нули до границы ALIGN и матрица эмбеддингов float32 построчно
+MAGIC = b"CLSNAP01"
+ALIGN = 64
+
+
+def _matrix_offset(header_size: int) -> int:
+    offset = len(MAGIC) + 8 + header_size
+    return offset + (-offset % ALIGN)
+
+
+def write_snapshot(path: str, ids: list[str], matrix: np.ndarray, meta: dict):
+    """
+    Пишет снимок индекса кластеров. Запись атомарная: читатели видят
+    либо прошлый снимок целиком, либо новый.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    header = json.dumps({**meta, "ids": ids, "shape": list(matrix.shape)}).encode("utf-8")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * (_matrix_offset(len(header)) - f.tell()))
+        matrix.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str):
+    """
+    Читает снимок: (meta, ids, matrix) или None, если файла нет. Матрица
+    отображается в память с копированием при записи — страницы читаются
+    с диска по мере обращения, а изменения строк остаются в процессе.
+    Повреждённый или обрезанный файл даёт ValueError.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    with f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} не является снимком кластеров")
+        try:
+            (header_size,) = struct.unpack("<Q", f.read(8))
+        except struct.error as e:
+            raise ValueError(f"{path}: обрезан заголовок снимка") from e
+        meta = json.loads(f.read(header_size))
+        file_size = os.fstat(f.fileno()).st_size
+    ids = meta.pop("ids")
+    shape = tuple(meta.pop("shape"))
+    if len(shape) != 2 or shape[0] != len(ids):
+        raise ValueError(f"{path}: форма матрицы {shape} не совпадает с числом кластеров {len(ids)}")
+    if _matrix_offset(header_size) + shape[0] * shape[1] * 4 > file_size:
+        raise ValueError(f"{path}: снимок обрезан, матрица {shape} не помещается в {file_size} байт")
+    if not ids:
+        return meta, ids, np.empty(shape, dtype=np.float32)
+    matrix = np.memmap(path, dtype=np.float32, mode="c", offset=_matrix_offset(header_size), shape=shape)
+    return meta, ids, matrix
@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует строку сущности: NFKC и схлопывание пробелов."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Кэш эмбеддингов сущностей с ключом по хэшу нормализованного текста и имени модели.
+
+    Первый уровень — LRU в памяти процесса, второй (необязательный) — общий
+    для реплик Redis. Модель вызывается только для промахов, одной пачкой.
+    """
+
+    def __init__(self, encode, model_name: str, max_size: int = 100_000,
+                 redis_client=None, redis_prefix: str = "embcache:", redis_ttl_hours: int = 24 * 7):
+        self.encode = encode
+        self.model_name = model_name
+        self.max_size = max_size
+        self.redis_client = redis_client
+        self.redis_prefix = redis_prefix
+        self.redis_ttl = redis_ttl_hours * 3600
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.encoded = 0
+        self.encode_seconds = 0.0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._lru[key] = embedding
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def get(self, texts: list[str]) -> np.ndarray:
+        """Возвращает эмбеддинги texts в исходном порядке, кодируя только промахи."""
+        normalized = [normalize_text(text) for text in texts]
+        keys = [self._key(text) for text in normalized]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                embedding = self._lru.get(key)
+                if embedding is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = embedding
+                    self.local_hits += 1
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing and self.redis_client is not None:
+            stored = self.redis_client.mget([f"{self.redis_prefix}{key}" for key in missing])
+            with self._lock:
+                for key, value in zip(missing, stored):
+                    if value is not None:
+                        embedding = np.frombuffer(value, dtype=np.float32)
+                        found[key] = embedding
+                        self._remember(key, embedding)
+                        self.redis_hits += keys.count(key)
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            texts_by_key = dict(zip(keys, normalized))
+            started = time.perf_counter()
+            encoded = self.encode([texts_by_key[key] for key in missing])
+            elapsed = time.perf_counter() - started
+            encoded = np.asarray(encoded, dtype=np.float32)
+
+            missing_set = set(missing)
+            with self._lock:
+                self.misses += sum(1 for key in keys if key in missing_set)
+                self.encoded += len(missing)
+                self.encode_seconds += elapsed
+                for key, embedding in zip(missing, encoded):
+                    found[key] = embedding
+                    self._remember(key, embedding)
+
+            if self.redis_client is not None:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, embedding in zip(missing, encoded):
+                    pipe.set(f"{self.redis_prefix}{key}", embedding.tobytes(), ex=self.redis_ttl)
+                pipe.execute()
+
+        return np.stack([found[key] for key in keys]) if keys else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self) -> dict:
+        """Статистика попаданий и сэкономленного времени кодирования."""
+        with self._lock:
+            hits = self.local_hits + self.redis_hits
+            total = hits + self.misses
+            per_item = self.encode_seconds / self.encoded if self.encoded else 0.0
+            return {
+                "size": len(self._lru),
+                "max_size": self.max_size,
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "encoded": self.encoded,
+                "encode_seconds": self.encode_seconds,
+                "seconds_saved": hits * per_item,
+            }
@@ -0,0 +1,41 @@
+"""
+Готовит локальный артефакт модели для быстрого старта сервиса.
+
+Экспорт в ONNX с динамической int8-квантизацией под набор инструкций
+процессора (arm64, avx2, avx512, avx512_vnni). Близость квантизованных
+эмбеддингов немного отличается от исходной модели — порог матчинга стоит
+проверить на своих данных.
+
+Пример:
+    python export_model.py --output /data/model
+    python export_model.py --output /data/model --backend onnx --quantize avx512_vnni
+
+Затем сервис запускается с MODEL_PATH=/data/model MODEL_BACKEND=onnx
+MODEL_FILE=onnx/model_qint8_avx512_vnni.onnx.
+"""
+import argparse
+
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="ai-forever/ru-en-RoSBERTa")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--quantize", choices=["arm64", "avx2", "avx512", "avx512_vnni"],
+                        help="int8-квантизация ONNX-модели под набор инструкций")
+    args = parser.parse_args()
+    if args.quantize and args.backend != "onnx":
+        parser.error("--quantize требует --backend onnx")
+
+    model = SentenceTransformer(args.model, backend=args.backend, device="cpu")
+    model.save(args.output)
+    print(f"✅ Model saved to {args.output}")
+    if args.quantize:
+        export_dynamic_quantized_onnx_model(model, args.quantize, args.output)
+        print(f"✅ Quantized model saved to {args.output}/onnx/model_qint8_{args.quantize}.onnx")
+
+
+if __name__ == "__main__":
+    main()
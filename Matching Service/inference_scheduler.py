@@ -0,0 +1,96 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class InferenceScheduler:
+    """
+    Микро-батчинг кодирования сущностей из конкурентных запросов.
+
+    Запросы складываются в очередь; фоновая задача собирает их в пачку,
+    пока не наберётся max_batch_size строк или не пройдёт max_wait_ms с
+    первого запроса пачки, и кодирует пачку в пуле потоков, не блокируя
+    event loop. Одновременно выполняется не больше workers пачек — пока
+    они заняты, следующая пачка продолжает набираться.
+    """
+
+    def __init__(self, encode, max_batch_size: int = 64, max_wait_ms: float = 5.0, workers: int = 1):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encode")
+        self._queue = None
+        self._slots = None
+        self._task = None
+        self._inflight = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def submit(self, texts: list[str]) -> np.ndarray:
+        """Кодирует texts в составе ближайшей пачки и возвращает их эмбеддинги."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            loop = asyncio.get_running_loop()
+            try:
+                embeddings = await loop.run_in_executor(self._executor, self.encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+        finally:
+            self._slots.release()
@@ -1,34 +1,123 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+import asyncio
 import hashlib
 import os # Добавляем импорт os
+import threading
+import time
 
 # Импортируем RedisHelper из вашего redis_helper.py
 from redis_helper import RedisHelper
+from cluster_index import ClusterIndex
+from embedding_cache import EmbeddingCache
+from inference_scheduler import InferenceScheduler
+from popularity import GRANULARITIES, PopularityIndex
+from model_loader import load_model
+import metrics
+from metrics import stage
 
 app = FastAPI()
 
 # Инициализируем RedisHelper
 # Можно передать хост и порт явно, или он возьмет их из переменных окружения
-redis_helper = RedisHelper()
+# CLUSTER_EVICTION_POLICY: size — вытесняются самые маленькие кластеры,
+# decay — самые редко и давно встречавшиеся (полураспад CLUSTER_HALF_LIFE_HOURS)
+redis_helper = RedisHelper(
+    eviction_policy=os.getenv("CLUSTER_EVICTION_POLICY", "size"),
+    half_life_hours=float(os.getenv("CLUSTER_HALF_LIFE_HOURS", 24)),
+)
 redis_client = redis_helper.get_client() # Получаем прямой доступ к клиенту Redis, если это нужно
 
-model = SentenceTransformer("ai-forever/ru-en-RoSBERTa")
+MODEL_NAME = "ai-forever/ru-en-RoSBERTa"
+# Модель грузится при прогреве в фоне. MODEL_PATH — локальный артефакт
+# (export_model.py), MODEL_BACKEND — torch или onnx, MODEL_FILE —
+# файл модели внутри артефакта, например квантизованный int8 ONNX
+MODEL_PATH = os.getenv("MODEL_PATH", "")
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+MODEL_FILE = os.getenv("MODEL_FILE", "")
+model = None
+
+# Снимок индекса кластеров: пишется раз в CLUSTER_SNAPSHOT_INTERVAL секунд
+# и при остановке, при старте заменяет полное чтение Redis. Пустой путь — без снимков
+CLUSTER_SNAPSHOT_PATH = os.getenv("CLUSTER_SNAPSHOT_PATH", "")
+CLUSTER_SNAPSHOT_INTERVAL = float(os.getenv("CLUSTER_SNAPSHOT_INTERVAL", 300))
 
 EMBED_PREFIX = "embed:"
 CLUSTER_PREFIX = "cluster:"
-MAX_CLUSTERS = 10_000
+# 0 — без ограничения на число кластеров
+MAX_CLUSTERS = int(os.getenv("MAX_CLUSTERS", 10_000))
 SIMILARITY_THRESHOLD = 0.8
+VERSION_KEY = "clusters:version"
+
+# exact — точный поиск по матрице, hnsw — приближённый (нужен hnswlib).
+# HNSW_EF — компромисс полнота/задержка для hnsw
+MATCHER_BACKEND = os.getenv("MATCHER_BACKEND", "exact")
+MATCHER_OPTIONS = {
+    "exact": {},
+    "hnsw": {
+        "m": int(os.getenv("HNSW_M", 16)),
+        "ef_construction": int(os.getenv("HNSW_EF_CONSTRUCTION", 200)),
+        "ef": int(os.getenv("HNSW_EF", 64)),
+    },
+}[MATCHER_BACKEND]
+
+# Резидентный индекс кластеров: грузится один раз при старте и дальше
+# обновляется инкрементально, полная перезагрузка — только если данные
+# в Redis поменяла другая реплика
+cluster_index = ClusterIndex(
+    redis_helper, SIMILARITY_THRESHOLD, CLUSTER_PREFIX, EMBED_PREFIX, VERSION_KEY,
+    backend=MATCHER_BACKEND, matcher_options=MATCHER_OPTIONS,
+)
+
+# Почасовые и посуточные счётчики упоминаний кластеров для дашбордов и
+# Prediction Service; хранятся POPULARITY_HOUR_RETENTION_HOURS и POPULARITY_DAY_RETENTION_DAYS
+popularity_index = PopularityIndex(
+    redis_client,
+    hour_retention_hours=float(os.getenv("POPULARITY_HOUR_RETENTION_HOURS", 168)),
+    day_retention_days=float(os.getenv("POPULARITY_DAY_RETENTION_DAYS", 365)),
+)
 
 class EntitiesRequest(BaseModel):
     entities: list[str]
 
 
+def encode(entities):
+    with stage("encode"):
+        return model.encode(entities, convert_to_numpy=True, normalize_embeddings=True)
+
+
+# Кэш эмбеддингов: LRU в памяти на EMBEDDING_CACHE_SIZE строк и,
+# при EMBEDDING_CACHE_REDIS=1, общий для реплик уровень в Redis
+# Квантизованная модель даёт другие эмбеддинги, поэтому файл модели входит в ключ кэша
+embedding_cache = EmbeddingCache(
+    encode, f"{MODEL_NAME}:{MODEL_FILE}" if MODEL_FILE else MODEL_NAME,
+    max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", 100_000)),
+    redis_client=redis_client if os.getenv("EMBEDDING_CACHE_REDIS", "0") == "1" else None,
+)
+
+
 def get_embeddings(entities):
-    return model.encode(entities, convert_to_numpy=True, normalize_embeddings=True)
+    return embedding_cache.get(entities)
+
+
+# Кодирование сущностей из конкурентных запросов собирается в пачки
+# (до INFERENCE_MAX_BATCH строк или INFERENCE_MAX_WAIT_MS ожидания)
+# и выполняется в пуле из INFERENCE_WORKERS потоков, вне event loop
+inference_scheduler = InferenceScheduler(
+    get_embeddings,
+    max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH", 64)),
+    max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", 5)),
+    workers=int(os.getenv("INFERENCE_WORKERS", 1)),
+)
+
+# Время этапов, счётчики и GET /metrics; PROFILING=1 включает профиль запроса по ?profile=1
+metrics.instrument(app, metrics.EmbeddingCacheCollector(embedding_cache))
+
+# Индекс кластеров и записи в Redis меняются только под этой блокировкой
+match_lock = threading.Lock()
 
 
 # Теперь эти функции будут использовать методы из redis_helper
@@ -40,38 +129,232 @@ def store_cluster(cluster_id, entity, embedding):
     redis_helper.store_cluster(cluster_id, entity, embedding, CLUSTER_PREFIX, EMBED_PREFIX)
 
 
-def prune_clusters_if_needed():
-    redis_helper.prune_clusters_if_needed(CLUSTER_PREFIX, EMBED_PREFIX, MAX_CLUSTERS)
+def prune_clusters_if_needed(incoming=0, exclude=()):
+    return redis_helper.prune_clusters_if_needed(CLUSTER_PREFIX, EMBED_PREFIX, MAX_CLUSTERS, incoming, exclude)
+
+
+def flush_assignments(updates):
+    return redis_helper.flush_assignments(updates, CLUSTER_PREFIX, EMBED_PREFIX)
+
+
+def find_best_cluster(embedding, matcher):
+    return matcher.best(embedding)
+
+
+# Готовность выставляется после прогрева: модель загружена и один раз
+# прогнана, индекс кластеров поднят и его матрица прочитана целиком
+ready = threading.Event()
+warmup_status = {"step": "starting", "error": None}
+WARMUP_RETRY_SECONDS = 5
+
+
+def warmup_step(step, func):
+    warmup_status["step"] = step
+    started = time.perf_counter()
+    result = func()
+    metrics.WARMUP_SECONDS.labels(step).set(time.perf_counter() - started)
+    return result
+
+
+def load_cluster_index():
+    redis_helper.migrate_cluster_members(CLUSTER_PREFIX)
+    redis_helper.rebuild_size_index(CLUSTER_PREFIX)
+    if not (CLUSTER_SNAPSHOT_PATH and cluster_index.restore(CLUSTER_SNAPSHOT_PATH)):
+        cluster_index.load()
+
+
+def warm_up():
+    """Прогрев в фоновом потоке; упавший шаг повторяется, пройденные не повторяются."""
+    global model
+    while True:
+        try:
+            if model is None:
+                model = warmup_step("model", lambda: load_model(MODEL_NAME, MODEL_PATH, MODEL_BACKEND, MODEL_FILE))
+            sample = warmup_step("encode", lambda: encode(["прогрев модели"]))
+            with match_lock:
+                warmup_step("clusters", load_cluster_index)
+                # Первый поиск читает всю матрицу: страницы снимка попадают в память до первого запроса
+                warmup_step("scoring", lambda: cluster_index.matcher.search(sample))
+            break
+        except Exception as e:
+            warmup_status["error"] = str(e) or type(e).__name__
+            print(f"❌ Warm-up failed at {warmup_status['step']}: {e}")
+            time.sleep(WARMUP_RETRY_SECONDS)
+    warmup_status.update(step="done", error=None)
+    ready.set()
+    print("✅ Matching service is ready")
+
+
+def save_cluster_snapshot():
+    try:
+        if cluster_index.save(CLUSTER_SNAPSHOT_PATH, match_lock):
+            print(f"✅ Cluster snapshot saved to {CLUSTER_SNAPSHOT_PATH}")
+    except Exception as e:
+        print(f"❌ Could not save cluster snapshot: {e}")
+
+
+async def snapshot_clusters_periodically():
+    while True:
+        await asyncio.sleep(CLUSTER_SNAPSHOT_INTERVAL)
+        await run_in_threadpool(save_cluster_snapshot)
+
+
+snapshot_task = None
+
+
+@app.on_event("startup")
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
 
-def find_best_cluster(embedding, clusters):
-    best_cluster_id = None
-    best_sim = -1
-    for cluster_id, data in clusters.items():
-        sim = cosine_similarity([embedding], [data["embedding"]])[0][0]
-        if sim > best_sim and sim >= SIMILARITY_THRESHOLD:
-            best_sim = sim
-            best_cluster_id = cluster_id
-    return best_cluster_id
+@app.on_event("startup")
+async def start_inference_scheduler():
+    await inference_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def stop_inference_scheduler():
+    await inference_scheduler.stop()
+
+
+@app.on_event("startup")
+async def start_cluster_snapshots():
+    global snapshot_task
+    if CLUSTER_SNAPSHOT_PATH:
+        snapshot_task = asyncio.create_task(snapshot_clusters_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_cluster_snapshots():
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+    if CLUSTER_SNAPSHOT_PATH and ready.is_set():
+        await run_in_threadpool(save_cluster_snapshot)
+
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """200 после прогрева, до него — 503 с текущим шагом прогрева."""
+    if ready.is_set():
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": "warming_up", **warmup_status})
+
+
+def assign_entities(entities, embeddings):
+    with match_lock, metrics.redis_commands():
+        return _assign_entities(entities, embeddings)
+
+
+def _assign_entities(entities, embeddings):
+    with stage("redis_load"):
+        cluster_index.sync()
+    matcher = cluster_index.matcher
+    new_assignments = {}
+    # {cluster_id: [формы, сумма эмбеддингов, число]} — всё, что запрос добавляет в кластер
+    updates = {}
+    created_ids = []
+    removed = []
+
+    # Вся пачка скорится одним матричным произведением,
+    # кластеры, созданные по ходу, видны следующим сущностям
+    with stage("scoring"):
+        assignments = matcher.match_batch(
+            embeddings, lambda i: hashlib.md5(entities[i].encode()).hexdigest()
+        )
+    for entity, emb, (cluster_id, created) in zip(entities, embeddings, assignments):
+        update = updates.setdefault(cluster_id, [[], np.zeros_like(emb, dtype=np.float32), 0])
+        update[0].append(entity)
+        update[1] += emb
+        update[2] += 1
+        if created:
+            created_ids.append(cluster_id)
+        new_assignments.setdefault(cluster_id, []).append(entity)
+
+    # Освобождаем место под новые кластеры один раз на запрос,
+    # не трогая кластеры, в которые пишет этот же запрос
+    if created_ids:
+        with stage("prune"):
+            removed, shortfall = prune_clusters_if_needed(len(created_ids), set(updates))
+            cluster_index.remove(removed)
+            popularity_index.forget(removed)
+            # Если вытеснить больше нечего, не сохраняются самые мелкие новые
+            # кластеры запроса: MAX_CLUSTERS соблюдается, а в ответе их id остаются
+            if shortfall:
+                dropped = sorted(created_ids, key=lambda cluster_id: updates[cluster_id][2])[:shortfall]
+                cluster_index.remove(dropped)
+                for cluster_id in dropped:
+                    del updates[cluster_id]
+                created_ids = [cluster_id for cluster_id in created_ids if cluster_id in updates]
+        metrics.CLUSTERS_CREATED.inc(len(created_ids))
+        metrics.CLUSTERS_PRUNED.inc(len(removed))
+    # Все назначения запроса уходят в Redis одним конвейером,
+    # центроиды кластеров сдвигаются на среднее новых эмбеддингов
+    with stage("store"):
+        cluster_index.update_centroids(flush_assignments(updates))
+        if created_ids or removed:
+            cluster_index.commit(created_ids, removed)
+    # Имя кластера — первая форма, с которой он попал в индекс популярности
+    with stage("popularity"):
+        popularity_index.record({cluster_id: (n, forms[0]) for cluster_id, (forms, _, n) in updates.items()})
+    metrics.ENTITIES_MATCHED.inc(len(entities))
+
+    return {"clusters": new_assignments}
 
 
 @app.post("/match")
 async def match_entities(req: EntitiesRequest):
     entities = req.entities
-    embeddings = get_embeddings(entities)
-    clusters = get_all_stored_clusters() # Используем обернутую функцию
-    new_assignments = {}
+    if not entities:
+        return {"clusters": {}}
+    if not ready.is_set():
+        raise HTTPException(status_code=503, detail="Сервис ещё прогревается")
+    embeddings = await inference_scheduler.submit(entities)
+    # Матчинг и синхронный Redis — в пуле потоков, чтобы не блокировать event loop
+    return await run_in_threadpool(assign_entities, entities, embeddings)
+
+
+@app.get("/cache/stats")
+def embedding_cache_stats():
+    return embedding_cache.stats()
+
+
+# Верхние границы размера ответа популярности: топ и число корзин истории
+MAX_POPULARITY_K = 1000
+MAX_POPULARITY_BUCKETS = 1000
+
+
+def check_granularity(granularity):
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity должна быть одной из: {', '.join(GRANULARITIES)}")
+
+
+@app.get("/popularity/top")
+def popularity_top(granularity: str = "day", k: int = Query(10, ge=1, le=MAX_POPULARITY_K),
+                   offset: int = Query(0, ge=0)):
+    """Самые упоминаемые кластеры за текущий час/день (offset — сколько периодов назад)."""
+    check_granularity(granularity)
+    return {"clusters": popularity_index.top(granularity, k, offset)}
+
+
+@app.get("/popularity/gainers")
+def popularity_gainers(granularity: str = "day", k: int = Query(10, ge=1, le=MAX_POPULARITY_K),
+                       offset: int = Query(0, ge=0)):
+    """Кластеры с наибольшим приростом упоминаний к предыдущему часу/дню."""
+    check_granularity(granularity)
+    return {"clusters": popularity_index.gainers(granularity, k, offset)}
 
-    for entity, emb in zip(entities, embeddings):
-        cluster_id = find_best_cluster(emb, clusters)
-        if cluster_id is None:
-            prune_clusters_if_needed() # Используем обернутую функцию
-            cluster_id = hashlib.md5(entity.encode()).hexdigest()
-            store_cluster(cluster_id, entity, emb) # Используем обернутую функцию
-            clusters[cluster_id] = {"members": [entity], "embedding": emb}
-        else:
-            # Используем rpush_to_cluster из redis_helper
-            redis_helper.rpush_to_cluster(cluster_id, entity, CLUSTER_PREFIX)
-        new_assignments.setdefault(cluster_id, []).append(entity)
 
-    return {"clusters": new_assignments}
\ No newline at end of file
+@app.get("/popularity/clusters/{cluster_id}/history")
+def popularity_history(cluster_id: str, granularity: str = "day",
+                       buckets: int = Query(7, ge=1, le=MAX_POPULARITY_BUCKETS)):
+    """
+    История упоминаний кластера. С параметрами по умолчанию counts —
+    готовый daily_counts для /detect Prediction Service.
+    """
+    check_granularity(granularity)
+    return popularity_index.history(cluster_id, granularity, buckets)
@@ -0,0 +1,75 @@
+import threading
+
+import redis
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+import service_metrics
+
+# Задержки внутри сервиса: от долей миллисекунды (скоринг) до секунд (кодирование большой пачки)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+SERVICE = service_metrics.ServiceMetrics("matching", "Время этапов обработки /match", LATENCY_BUCKETS)
+CLUSTERS_CREATED = Counter("matching_clusters_created", "Созданные кластеры")
+CLUSTERS_PRUNED = Counter("matching_clusters_pruned", "Вытесненные кластеры")
+ENTITIES_MATCHED = Counter("matching_entities", "Сопоставленные сущности")
+REDIS_COMMANDS = Counter("matching_redis_commands", "Команды, отправленные в Redis")
+REDIS_COMMANDS_PER_REQUEST = Histogram("matching_redis_commands_per_request", "Команды Redis на одно сопоставление",
+                                       buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000))
+WARMUP_SECONDS = Gauge("matching_warmup_seconds", "Длительность шагов прогрева при старте", ["step"])
+
+# Счётчик команд текущего потока: назначения одного запроса идут в одном потоке
+_local = threading.local()
+
+
+class CountingConnection(redis.Connection):
+    """
+    Соединение Redis, считающее отправленные команды, в том числе внутри
+    конвейеров. Вызов Lua-скрипта считается одной командой: команды,
+    которые скрипт выполняет внутри Redis, клиенту не видны.
+    """
+
+    def send_command(self, *args, **kwargs):
+        _count_commands(1)
+        return super().send_command(*args, **kwargs)
+
+    def pack_commands(self, commands):
+        commands = list(commands)
+        _count_commands(len(commands))
+        return super().pack_commands(commands)
+
+
+def _count_commands(n: int):
+    REDIS_COMMANDS.inc(n)
+    _local.commands = getattr(_local, "commands", 0) + n
+
+
+class redis_commands:
+    """Считает команды Redis, отправленные потоком внутри блока, и пишет их число в гистограмму."""
+
+    def __enter__(self):
+        self.started = getattr(_local, "commands", 0)
+
+    def __exit__(self, *exc):
+        REDIS_COMMANDS_PER_REQUEST.observe(getattr(_local, "commands", 0) - self.started)
+
+
+class EmbeddingCacheCollector:
+    """Отдаёт статистику кэша эмбеддингов в момент опроса, без работы на горячем пути."""
+
+    def __init__(self, embedding_cache):
+        self.embedding_cache = embedding_cache
+
+    def collect(self):
+        stats = self.embedding_cache.stats()
+        lookups = CounterMetricFamily("matching_embedding_cache_lookups", "Поиски в кэше эмбеддингов", labels=["result"])
+        lookups.add_metric(["local_hit"], stats["local_hits"])
+        lookups.add_metric(["redis_hit"], stats["redis_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        yield GaugeMetricFamily("matching_embedding_cache_size", "Строк в локальном кэше эмбеддингов", value=stats["size"])
+
+
+# Общие для сервисов таймер этапов и подключение метрик к приложению
+stage = SERVICE.stage
+instrument = SERVICE.instrument
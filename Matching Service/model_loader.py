@@ -0,0 +1,30 @@
+import os
+
+from sentence_transformers import SentenceTransformer
+
+
+def load_model(name: str, path: str = "", backend: str = "torch", file_name: str = "", device: str = "cpu"):
+    """
+    Загружает SentenceTransformer из локального артефакта path, а если его
+    нет — из хаба по имени name. PyTorch-модель из хаба сохраняется в path,
+    чтобы следующие запуски не ходили в сеть. Для backend onnx
+    file_name выбирает файл модели внутри артефакта, например квантизованный
+    onnx/model_qint8_avx512_vnni.onnx из export_model.py.
+    """
+    kwargs = {"device": device}
+    if backend != "torch":
+        kwargs["backend"] = backend
+    if file_name:
+        kwargs["model_kwargs"] = {"file_name": file_name}
+
+    if path and os.path.isdir(path):
+        model = SentenceTransformer(path, local_files_only=True, **kwargs)
+        print(f"✅ Model loaded from {path} ({backend})")
+        return model
+
+    model = SentenceTransformer(name, **kwargs)
+    print(f"✅ Model {name} loaded from hub ({backend})")
+    if path and backend == "torch":
+        model.save(path)
+        print(f"✅ Model saved to {path}")
+    return model
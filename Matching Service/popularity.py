@@ -0,0 +1,158 @@
+import time
+
+# Длина корзины и время хранения по умолчанию для каждой гранулярности
+GRANULARITIES = {"hour": 3600, "day": 86400}
+
+# Учитывает назначения запроса в одной корзине: счёт кластера в корзине,
+# прирост относительно предыдущей корзины (индекс лидеров роста) и имя кластера.
+# KEYS: корзина, предыдущая корзина, лидеры роста корзины, хэш имён
+# ARGV: время хранения в секундах, затем тройки cluster_id, n, имя
+RECORD_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+for i = 2, #ARGV, 3 do
+    local id = ARGV[i]
+    local count = tonumber(redis.call('ZINCRBY', KEYS[1], ARGV[i + 1], id))
+    local previous = tonumber(redis.call('ZSCORE', KEYS[2], id) or '0')
+    redis.call('ZADD', KEYS[3], count - previous, id)
+    redis.call('HSETNX', KEYS[4], id, ARGV[i + 2])
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+return 1
+"""
+
+# Удаляет имена кластеров, не упоминавшихся дольше самого длинного хранения:
+# их корзины уже истекли. За вызов — не больше ARGV[2] кластеров.
+# KEYS: время последнего упоминания, хэш имён; ARGV: граница времени, лимит
+TRIM_NAMES_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids > 0 then
+    redis.call('HDEL', KEYS[2], unpack(ids))
+    redis.call('ZREM', KEYS[1], unpack(ids))
+end
+return #ids
+"""
+
+TRIM_BATCH = 100
+
+
+class PopularityIndex:
+    """
+    Агрегаты популярности кластеров по часам и дням.
+
+    На каждую корзину (час или сутки UTC) — sorted set кластер → число
+    упоминаний и sorted set прироста к предыдущей корзине. Оба живут
+    retention и затем истекают сами. Топ и лидеры роста — ZREVRANGE по одной
+    корзине, история кластера — ZSCORE по нужным корзинам, то есть O(K) и
+    O(число корзин) без обхода списков членов кластеров.
+
+    Имена кластеров удаляются при вытеснении кластера и, даже без
+    вытеснения, когда кластер не упоминался дольше срока хранения корзин.
+    """
+
+    def __init__(self, redis_client, prefix: str = "popularity:", hour_retention_hours: float = 168,
+                 day_retention_days: float = 365):
+        self.client = redis_client
+        self.prefix = prefix
+        self.names_key = f"{prefix}names"
+        self.seen_key = f"{prefix}seen"
+        self.retention = {
+            "hour": int(hour_retention_hours * 3600),
+            "day": int(day_retention_days * 86400),
+        }
+        self._record = self.client.register_script(RECORD_SCRIPT)
+        self._trim_names = self.client.register_script(TRIM_NAMES_SCRIPT)
+
+    @staticmethod
+    def bucket(granularity: str, timestamp: float | None = None) -> int:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        return int((time.time() if timestamp is None else timestamp) // GRANULARITIES[granularity])
+
+    def _key(self, kind: str, granularity: str, bucket: int) -> str:
+        return f"{self.prefix}{kind}:{granularity}:{bucket}"
+
+    @staticmethod
+    def _decode(value):
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def record(self, counts: dict, timestamp: float | None = None):
+        """counts: {cluster_id: (число упоминаний, имя кластера)} — учитывает их во всех гранулярностях."""
+        if not counts:
+            return
+        args = [x for cluster_id, (n, name) in counts.items() for x in (cluster_id, n, name.encode("utf-8"))]
+        pipe = self.client.pipeline(transaction=False)
+        for granularity in GRANULARITIES:
+            bucket = self.bucket(granularity, timestamp)
+            self._record(
+                keys=[self._key("counts", granularity, bucket), self._key("counts", granularity, bucket - 1),
+                      self._key("gainers", granularity, bucket), self.names_key],
+                args=[self.retention[granularity], *args],
+                client=pipe,
+            )
+        now = time.time() if timestamp is None else timestamp
+        pipe.zadd(self.seen_key, {cluster_id: now for cluster_id in counts}, gt=True)
+        self._trim_names(keys=[self.seen_key, self.names_key],
+                         args=[now - max(self.retention.values()), TRIM_BATCH], client=pipe)
+        pipe.execute()
+
+    def forget(self, cluster_ids):
+        """
+        Удаляет имена вытесненных кластеров. Их счётчики истекут вместе с
+        корзинами, а до того top и gainers пропускают кластеры без имени.
+        """
+        if cluster_ids:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hdel(self.names_key, *cluster_ids)
+            pipe.zrem(self.seen_key, *cluster_ids)
+            pipe.execute()
+
+    def _with_names(self, pairs, field: str) -> list[dict]:
+        ids = [self._decode(cluster_id) for cluster_id, _ in pairs]
+        names = self.client.hmget(self.names_key, ids) if ids else []
+        return [
+            {"cluster_id": cluster_id, "name": self._decode(name), field: int(score)}
+            for cluster_id, name, (_, score) in zip(ids, names, pairs)
+        ]
+
+    def _first_named(self, fetch, k: int, field: str) -> list[dict]:
+        """
+        Первые k записей fetch(start, num) с известным именем: записи
+        вытесненных кластеров пропускаются, вместо них дочитываются следующие.
+        """
+        result = []
+        start = 0
+        while len(result) < k:
+            pairs = fetch(start, k)
+            result.extend(entry for entry in self._with_names(pairs, field) if entry["name"] is not None)
+            if len(pairs) < k:
+                break
+            start += k
+        return result[:k]
+
+    def top(self, granularity: str = "day", k: int = 10, offset: int = 0) -> list[dict]:
+        """K самых упоминаемых кластеров в текущей корзине (offset — сколько корзин назад)."""
+        key = self._key("counts", granularity, self.bucket(granularity) - offset)
+        return self._first_named(
+            lambda start, num: self.client.zrevrange(key, start, start + num - 1, withscores=True), k, "count")
+
+    def gainers(self, granularity: str = "day", k: int = 10, offset: int = 0) -> list[dict]:
+        """K кластеров с наибольшим приростом упоминаний к предыдущей корзине."""
+        key = self._key("gainers", granularity, self.bucket(granularity) - offset)
+        return self._first_named(
+            lambda start, num: self.client.zrevrangebyscore(key, "+inf", "(0", start=start, num=num, withscores=True),
+            k, "gain")
+
+    def history(self, cluster_id: str, granularity: str = "day", buckets: int = 7) -> dict:
+        """Число упоминаний кластера в последних buckets корзинах, от старых к текущей."""
+        current = self.bucket(granularity)
+        bucket_ids = range(current - buckets + 1, current + 1)
+        pipe = self.client.pipeline(transaction=False)
+        for bucket in bucket_ids:
+            pipe.zscore(self._key("counts", granularity, bucket), cluster_id)
+        return {
+            "cluster_id": cluster_id,
+            "granularity": granularity,
+            "buckets": [bucket * GRANULARITIES[granularity] for bucket in bucket_ids],
+            "counts": [int(score) if score is not None else 0 for score in pipe.execute()],
+        }
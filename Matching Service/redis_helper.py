@@ -1,20 +1,130 @@
 import os
+import math
+import time
 import redis
 import pickle
 import numpy as np # Добавляем numpy для работы с эмбеддингами
 
+from metrics import CountingConnection
+
+# Сколько ключей Redis отдаёт за один шаг SCAN и сколько команд уходит в один конвейер/MGET
+SCAN_COUNT = 1000
+BATCH_SIZE = 1000
+
+# Атомарно учитывает назначения в кластер: увеличивает счётчики форм в хэше
+# членов, обновляет скользящее среднее эмбеддингов (центроид) и число назначений,
+# а также счёт кластера в sorted set индекса вытеснения. Возвращает новый центроид.
+# KEYS: хэш членов, индекс вытеснения, ключ центроида, хэш числа назначений
+# ARGV: cluster_id, политика (size|decay), now/tau, n, сумма эмбеддингов или "", форма, счётчик, ...
+ASSIGN_SCRIPT = """
+local id = ARGV[1]
+local n = tonumber(ARGV[4])
+local delta = ARGV[5]
+for i = 6, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+
+local centroid = false
+if delta ~= '' then
+    local count = tonumber(redis.call('HGET', KEYS[4], id) or '0')
+    local current = redis.call('GET', KEYS[3])
+    if not current or count == 0 then
+        count = 0
+        current = nil
+    end
+    -- mean' = (mean * count + sum) / (count + n), по float32 на компоненту
+    local parts = {}
+    for offset = 1, #delta, 4 do
+        local value = struct.unpack('<f', delta, offset)
+        if current then
+            value = value + struct.unpack('<f', current, offset) * count
+        end
+        parts[#parts + 1] = struct.pack('<f', value / (count + n))
+    end
+    centroid = table.concat(parts)
+    redis.call('SET', KEYS[3], centroid)
+    redis.call('HINCRBY', KEYS[4], id, n)
+end
+
+if ARGV[2] == 'size' then
+    redis.call('ZINCRBY', KEYS[2], n, id)
+else
+    -- log(сумма exp(t_i / tau)) по всем обращениям: затухающий счётчик в лог-шкале
+    local add = tonumber(ARGV[3]) + math.log(n)
+    local cur = redis.call('ZSCORE', KEYS[2], id)
+    local score = add
+    if cur then
+        cur = tonumber(cur)
+        local hi, lo = math.max(cur, add), math.min(cur, add)
+        score = hi + math.log(1 + math.exp(lo - hi))
+    end
+    redis.call('ZADD', KEYS[2], score, id)
+end
+return centroid
+"""
+
+# Вытесняет ARGV[1] кластеров с наименьшим счётом, пропуская исключённые.
+# Ключи кластеров и эмбеддингов скрипт собирает сам из префиксов: какие
+# кластеры удалять, известно только внутри скрипта. Поэтому нужен одиночный
+# Redis (не Redis Cluster, где все ключи скрипта должны быть в KEYS).
+# KEYS: индекс вытеснения, хэш числа назначений; ARGV: сколько удалить, префикс кластеров, префикс эмбеддингов, исключения...
+EVICT_SCRIPT = """
+local count = tonumber(ARGV[1])
+local exclude = {}
+for i = 4, #ARGV do exclude[ARGV[i]] = true end
+local candidates = redis.call('ZRANGE', KEYS[1], 0, count + #ARGV - 4)
+local removed = {}
+for _, id in ipairs(candidates) do
+    if #removed >= count then break end
+    if not exclude[id] then
+        redis.call('ZREM', KEYS[1], id)
+        redis.call('HDEL', KEYS[2], id)
+        redis.call('DEL', ARGV[2] .. id, ARGV[3] .. id)
+        removed[#removed + 1] = id
+    end
+end
+return removed
+"""
+
+# Публикует изменения состава кластеров: увеличивает версию и пишет в журнал
+# запись с id "<версия>-0", чтобы реплики могли применить изменения по порядку.
+# KEYS: счётчик версии, журнал изменений; ARGV: длина журнала, добавленные id, удалённые id (через запятую)
+COMMIT_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], version .. '-0', 'added', ARGV[2], 'removed', ARGV[3])
+return version
+"""
+
 class RedisHelper:
-    def __init__(self, host=None, port=None, db=0):
+    def __init__(self, host=None, port=None, db=None, sizes_key="clusters:sizes", counts_key="clusters:counts",
+                 migrated_key="clusters:members_migrated", eviction_policy="size", half_life_hours=24.0):
         # Получаем хост и порт из переменных окружения, если не переданы
         self.host = host if host else os.getenv("REDIS_HOST", "redis")
         self.port = int(port) if port else int(os.getenv("REDIS_PORT", 6379))
-        self.db = db
+        self.db = db if db is not None else int(os.getenv("REDIS_DB", 0))
+        # Индекс вытеснения кластеров: size — по числу членов,
+        # decay — по числу обращений с экспоненциальным затуханием (LFU/LRU)
+        if eviction_policy not in ("size", "decay"):
+            raise ValueError(f"Unknown eviction policy: {eviction_policy}")
+        self.sizes_key = sizes_key
+        # Число назначений в каждый кластер — вес его центроида
+        self.counts_key = counts_key
+        # Отметка о завершённой миграции: повторный старт не сканирует все ключи
+        self.migrated_key = migrated_key
+        self.eviction_policy = eviction_policy
+        self.decay_tau = half_life_hours * 3600 / math.log(2)
         self.client = self._connect()
+        self._assign = self.client.register_script(ASSIGN_SCRIPT)
+        self._evict = self.client.register_script(EVICT_SCRIPT)
+        self._commit = self.client.register_script(COMMIT_SCRIPT)
 
     def _connect(self):  
         """Пытаемся подключиться к Redis."""
         try:
-            r = redis.Redis(host=self.host, port=self.port, db=self.db, decode_responses=False) # decode_responses=False для pickle/numpy.tobytes
+            # CountingConnection считает команды для метрик
+            pool = redis.ConnectionPool(host=self.host, port=self.port, db=self.db, decode_responses=False,
+                                        connection_class=CountingConnection)
+            r = redis.Redis(connection_pool=pool)
             r.ping() # Проверяем соединение
             print(f"✅ Connected to Redis at {self.host}:{self.port}")
             return r
@@ -53,55 +163,217 @@ class RedisHelper:
             print(f"❌ Error loading from Redis key {key}: {e}")
             raise
 
-    def get_all_stored_clusters(self, cluster_prefix: str, embed_prefix: str):
-        """Получает все хранимые кластеры из Redis."""
-        cluster_keys = self.client.keys(f"{cluster_prefix}*")
+    @staticmethod
+    def _cluster_id(key) -> str:
+        return key.decode().split(":")[-1] if isinstance(key, bytes) else key.split(":")[-1]
+
+    def scan_keys(self, pattern: str, count: int = SCAN_COUNT):
+        """Итерирует ключи по шаблону через SCAN, не блокируя Redis, в отличие от KEYS."""
+        return self.client.scan_iter(match=pattern, count=count)
+
+    def _chunks(self, items, size: int = BATCH_SIZE):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def get_all_stored_clusters(self, cluster_prefix: str, embed_prefix: str, with_members: bool = True):
+        """
+        Получает все хранимые кластеры из Redis.
+        Ключи перебираются через SCAN, члены и центроиды читаются пачками:
+        один конвейер HGETALL и один MGET на каждые BATCH_SIZE кластеров.
+        "embedding" — нормализованный центроид, "members" — {форма: счётчик}.
+        """
         clusters = {}
-        for key in cluster_keys:
-            cluster_id = key.decode().split(":")[-1] if isinstance(key, bytes) else key.split(":")[-1]
-            # decode_responses=True в инициализации клиента Redis для lrange и get
-            # Но если вы используете pickle.dumps для embedding, то клиент должен быть decode_responses=False
-            # Давайте предположим, что lrange будет возвращать байты, а мы их декодируем
-            members_bytes = self.client.lrange(key, 0, -1)
-            members = [m.decode('utf-8') for m in members_bytes] # Декодируем члены кластера
-
-            emb_key = f"{embed_prefix}{cluster_id}"
-            emb_bytes = self.client.get(emb_key) # Получаем эмбеддинг как байты
-
-            if emb_bytes:
-                # Предполагаем, что эмбеддинги сохраняются как байты numpy
-                # Если вы сохраняете через np.array2string, то нужно будет раскомментировать строку ниже
-                # emb = np.fromstring(emb_bytes.decode('utf-8').strip('[]'), sep=',')
-                emb = np.frombuffer(emb_bytes, dtype=np.float32) # Или тот dtype, который вы используете для эмбеддингов
-                clusters[cluster_id] = {"members": members, "embedding": emb}
+        for keys in self._chunks(self.scan_keys(f"{cluster_prefix}*")):
+            cluster_ids = [self._cluster_id(key) for key in keys]
+            members_list = [{}] * len(keys)
+            if with_members:
+                pipe = self.client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.hgetall(key)
+                members_list = pipe.execute()
+            # Центроиды сохраняются как байты numpy float32
+            embeddings = self.client.mget([f"{embed_prefix}{cluster_id}" for cluster_id in cluster_ids])
+            counts = self.client.hmget(self.counts_key, cluster_ids)
+
+            for cluster_id, members_bytes, emb_bytes, count in zip(cluster_ids, members_list, embeddings, counts):
+                if emb_bytes:
+                    members = {m.decode('utf-8'): int(c) for m, c in members_bytes.items()} # Декодируем члены кластера
+                    emb = np.frombuffer(emb_bytes, dtype=np.float32)
+                    clusters[cluster_id] = {
+                        "members": members,
+                        "embedding": emb / (np.linalg.norm(emb) or 1.0),
+                        "count": int(count) if count is not None else 1,
+                    }
         return clusters
 
+    def flush_assignments(self, updates: dict, cluster_prefix: str, embed_prefix: str) -> dict:
+        """
+        Записывает все назначения запроса одним конвейером.
+
+        updates: {cluster_id: (members, embedding_sum, n)} — формы сущностей,
+        сумма их эмбеддингов и их число (embedding_sum=None — без обновления центроида).
+        Возвращает {cluster_id: новый центроид (ненормализованный)}.
+        """
+        if not updates:
+            return {}
+        now = time.time() / self.decay_tau
+        pipe = self.client.pipeline(transaction=False)
+        for cluster_id, (members, embedding_sum, n) in updates.items():
+            forms = {}
+            for member in members:
+                forms[member] = forms.get(member, 0) + 1
+            delta = b"" if embedding_sum is None else np.asarray(embedding_sum, dtype="<f4").tobytes()
+            self._assign(
+                keys=[f"{cluster_prefix}{cluster_id}", self.sizes_key, f"{embed_prefix}{cluster_id}", self.counts_key],
+                args=[cluster_id, self.eviction_policy, now, n, delta,
+                      *[x for form, c in forms.items() for x in (form.encode('utf-8'), c)]],
+                client=pipe,
+            )
+        centroids = {}
+        for cluster_id, centroid in zip(updates, pipe.execute()):
+            if centroid:
+                centroids[cluster_id] = np.frombuffer(centroid, dtype="<f4").astype(np.float32)
+        return centroids
+
     def store_cluster(self, cluster_id: str, entity: str, embedding: np.ndarray, cluster_prefix: str, embed_prefix: str):
         """Сохраняет новый кластер в Redis."""
-        self.client.rpush(f"{cluster_prefix}{cluster_id}", entity.encode('utf-8')) # Кодируем сущность в байты
-        # Сохраняем эмбеддинг как байты (наиболее эффективно)
-        self.client.set(f"{embed_prefix}{cluster_id}", embedding.tobytes())
-        # Если вы хотите сохранять как строку, используйте:
-        # self.client.set(f"{embed_prefix}{cluster_id}", np.array2string(embedding, separator=',').encode('utf-8'))
+        self.flush_assignments({cluster_id: ([entity], embedding, 1)}, cluster_prefix, embed_prefix)
 
     def rpush_to_cluster(self, cluster_id: str, entity: str, cluster_prefix: str):
-        """Добавляет сущность в существующий кластер."""
-        self.client.rpush(f"{cluster_prefix}{cluster_id}", entity.encode('utf-8')) # Кодируем сущность в байты
+        """Добавляет сущность в существующий кластер (без обновления центроида)."""
+        self.flush_assignments({cluster_id: ([entity], None, 1)}, cluster_prefix, "")
+
+    def get_version(self, key: str) -> int:
+        """Возвращает текущее значение счётчика версии (0, если ключа нет)."""
+        value = self.client.get(key)
+        return int(value) if value is not None else 0
+
+    def bump_version(self, key: str) -> int:
+        """Увеличивает счётчик версии и возвращает новое значение."""
+        return self.client.incr(key)
 
-    def prune_clusters_if_needed(self, cluster_prefix: str, embed_prefix: str, max_clusters: int):
-        """Удаляет старые кластеры, если их количество превышает MAX_CLUSTERS."""
-        cluster_keys = self.client.keys(f"{cluster_prefix}*")
-        if len(cluster_keys) <= max_clusters:
+    def commit_changes(self, version_key: str, changes_key: str, added, removed, maxlen: int) -> int:
+        """Увеличивает версию и записывает в журнал добавленные и удалённые кластеры. Возвращает новую версию."""
+        return self._commit(keys=[version_key, changes_key], args=[maxlen, ",".join(added), ",".join(removed)])
+
+    def get_changes(self, changes_key: str, after: int, upto: int) -> list:
+        """Записи журнала для версий after+1..upto: [(версия, добавленные id, удалённые id)]."""
+        changes = []
+        for entry_id, fields in self.client.xrange(changes_key, f"{after + 1}-0", f"{upto}-0"):
+            version = int(entry_id.split(b"-")[0])
+            added, removed = fields[b"added"].decode(), fields[b"removed"].decode()
+            changes.append((version, added.split(",") if added else [], removed.split(",") if removed else []))
+        return changes
+
+    def get_cluster_embeddings(self, cluster_ids, embed_prefix: str) -> dict:
+        """Нормализованные центроиды кластеров; кластеры без центроида пропускаются."""
+        embeddings = {}
+        for chunk in self._chunks(list(cluster_ids)):
+            for cluster_id, emb_bytes in zip(chunk, self.client.mget([f"{embed_prefix}{cluster_id}" for cluster_id in chunk])):
+                if emb_bytes:
+                    emb = np.frombuffer(emb_bytes, dtype=np.float32)
+                    embeddings[cluster_id] = emb / (np.linalg.norm(emb) or 1.0)
+        return embeddings
+
+    def count_clusters(self) -> int:
+        """Число кластеров в индексе вытеснения."""
+        return self.client.zcard(self.sizes_key)
+
+    def migrate_cluster_members(self, cluster_prefix: str):
+        """
+        Переводит кластеры, хранимые старым форматом (список всех вхождений),
+        в хэш {форма: счётчик} и заполняет число назначений.
+        """
+        if self.client.exists(self.migrated_key):
             return
+        migrated = 0
+        for keys in self._chunks(self.scan_keys(f"{cluster_prefix}*")):
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.type(key)
+            list_keys = [key for key, key_type in zip(keys, pipe.execute()) if key_type == b"list"]
+            if not list_keys:
+                continue
+            pipe = self.client.pipeline(transaction=False)
+            for key in list_keys:
+                pipe.lrange(key, 0, -1)
+            members_list = pipe.execute()
 
-        cluster_sizes = []
-        for key in cluster_keys:
-            size = self.client.llen(key)
-            cluster_sizes.append((key, size))
+            pipe = self.client.pipeline(transaction=True)
+            for key, members in zip(list_keys, members_list):
+                forms = {}
+                for member in members:
+                    forms[member] = forms.get(member, 0) + 1
+                pipe.delete(key)
+                if forms:
+                    pipe.hset(key, mapping=forms)
+                pipe.hsetnx(self.counts_key, self._cluster_id(key), max(len(members), 1))
+            pipe.execute()
+            migrated += len(list_keys)
+        if migrated:
+            print(f"✅ Migrated {migrated} cluster member lists to hashes")
+        self.client.set(self.migrated_key, 1)
 
-        cluster_sizes.sort(key=lambda x: x[1])
-        to_remove = len(cluster_keys) - max_clusters
+    def rebuild_size_index(self, cluster_prefix: str):
+        """
+        Строит индекс вытеснения по уже хранимым кластерам, если политика
+        индекса ещё не записана (данные записаны до появления индекса) или
+        он построен другой политикой вытеснения: счёты size и decay
+        несовместимы. Политика индекса хранится рядом, в ключе
+        <sizes_key>:policy; при той же политике индекс ведётся на лету, и
+        пустой индекс значит, что кластеров нет.
+        """
+        policy_key = f"{self.sizes_key}:policy"
+        policy = self.client.get(policy_key)
+        if policy is not None and policy.decode() == self.eviction_policy:
+            return
+        if policy is not None:
+            print(f"ℹ️ Eviction policy changed from {policy.decode()} to {self.eviction_policy}, rebuilding size index")
+        # Строим во временный ключ и подменяем индекс одной транзакцией
+        rebuild_key = f"{self.sizes_key}:rebuild"
+        self.client.delete(rebuild_key)
+        now = time.time() / self.decay_tau
+        for keys in self._chunks(self.scan_keys(f"{cluster_prefix}*")):
+            cluster_ids = [self._cluster_id(key) for key in keys]
+            sizes = [int(size) if size is not None else 1 for size in self.client.hmget(self.counts_key, cluster_ids)]
+            if self.eviction_policy == "size":
+                scores = dict(zip(cluster_ids, sizes))
+            else:
+                scores = {cluster_id: now + math.log(max(size, 1)) for cluster_id, size in zip(cluster_ids, sizes)}
+            self.client.zadd(rebuild_key, scores)
+        pipe = self.client.pipeline(transaction=True)
+        if self.client.exists(rebuild_key):
+            pipe.rename(rebuild_key, self.sizes_key)
+        else:
+            pipe.delete(self.sizes_key)
+        pipe.set(policy_key, self.eviction_policy)
+        pipe.execute()
+        rebuilt = self.client.zcard(self.sizes_key)
+        if rebuilt:
+            print(f"✅ Rebuilt cluster size index: {rebuilt} clusters")
 
-        for i in range(to_remove):
-            self.client.delete(cluster_sizes[i][0])
-            self.client.delete(cluster_sizes[i][0].replace(cluster_prefix, embed_prefix))
\ No newline at end of file
+    def prune_clusters_if_needed(self, cluster_prefix: str, embed_prefix: str, max_clusters: int,
+                                 incoming: int = 0, exclude=()):
+        """
+        Удаляет кластеры с наименьшим счётом в индексе вытеснения, чтобы вместе
+        с incoming новыми их было не больше max_clusters. Кластеры из exclude не трогаются.
+        Возвращает (id удалённых кластеров, сколько мест освободить не удалось —
+        на столько меньше новых кластеров можно сохранить). max_clusters <= 0
+        отключает ограничение.
+        """
+        if max_clusters <= 0:
+            return [], 0
+        to_remove = self.client.zcard(self.sizes_key) + incoming - max_clusters
+        if to_remove <= 0:
+            return [], 0
+        removed = self._evict(
+            keys=[self.sizes_key, self.counts_key],
+            args=[to_remove, cluster_prefix, embed_prefix, *exclude],
+        )
+        return [cluster_id.decode() for cluster_id in removed], to_remove - len(removed)
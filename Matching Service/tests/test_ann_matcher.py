@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+hnswlib = pytest.importorskip("hnswlib")
+
+from ann_matcher import HNSWClusterMatcher
+
+
+def unit_rows(rng, n, dim):
+    rows = rng.normal(size=(n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def assert_consistent(matcher, expected):
+    assert sorted(matcher.ids()) == sorted(expected)
+    for cluster_id, embedding in expected.items():
+        np.testing.assert_allclose(matcher.get_embedding(cluster_id), embedding, atol=1e-6)
+    ids, matrix = matcher.export()
+    assert len(ids) == len(matrix) == len(expected)
+    found, _ = matcher.search(np.stack(list(expected.values())))
+    assert set(found) <= set(expected)
+
+
+@pytest.mark.parametrize("n", [64, 256])
+def test_churn_keeps_every_live_cluster_reachable(n):
+    rng = np.random.default_rng(n)
+    dim = 16
+    matcher = HNSWClusterMatcher(0.5, dim=dim, capacity=n)
+    expected = {}
+    for i, row in enumerate(unit_rows(rng, n, dim)):
+        matcher.add(f"c{i}", row)
+        expected[f"c{i}"] = row
+
+    next_id = n
+    for _ in range(4):
+        for cluster_id in list(expected)[::2]:
+            matcher.remove(cluster_id)
+            del expected[cluster_id]
+        for row in unit_rows(rng, n // 2, dim):
+            matcher.add(f"c{next_id}", row)
+            expected[f"c{next_id}"] = row
+            next_id += 1
+        assert_consistent(matcher, expected)
+
+    for cluster_id in list(expected):
+        matcher.remove(cluster_id)
+    assert len(matcher) == 0
+
+
+def test_update_existing_cluster_keeps_label():
+    rng = np.random.default_rng(0)
+    first, second = unit_rows(rng, 2, 8)
+    matcher = HNSWClusterMatcher(0.5, dim=8)
+    matcher.add("a", first)
+    matcher.add("a", second)
+    assert len(matcher) == 1
+    np.testing.assert_allclose(matcher.get_embedding("a"), second, atol=1e-6)
+
+
+def test_grows_past_capacity_after_deletions():
+    rng = np.random.default_rng(1)
+    matcher = HNSWClusterMatcher(0.5, dim=8, capacity=4)
+    rows = unit_rows(rng, 12, 8)
+    for i in range(4):
+        matcher.add(f"c{i}", rows[i])
+    matcher.remove("c0")
+    expected = {f"c{i}": rows[i] for i in range(1, 4)}
+    for i in range(4, 12):
+        matcher.add(f"c{i}", rows[i])
+        expected[f"c{i}"] = rows[i]
+    assert_consistent(matcher, expected)
@@ -0,0 +1,83 @@
+import re
+
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _split_long(unit: str, max_chars: int) -> list[str]:
+    """Режет слишком длинное предложение по словам, а слова длиннее max_chars — на куски по max_chars."""
+    words = []
+    for word in unit.split():
+        words.extend(word[i:i + max_chars] for i in range(0, len(word), max_chars))
+    parts, current = [], ""
+    for word in words:
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _sentences(text: str, max_chars: int) -> list[str]:
+    units = []
+    for paragraph in PARAGRAPH_RE.split(text):
+        for sentence in SENTENCE_RE.split(paragraph.strip()):
+            if not sentence:
+                continue
+            units.extend(_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    return units
+
+
+def split_text(text: str, max_chars: int = 4000, overlap_chars: int = 300) -> list[str]:
+    """
+    Делит текст на куски не длиннее max_chars по границам абзацев и предложений.
+    Каждый следующий кусок начинается с последних предложений предыдущего
+    (не больше overlap_chars), чтобы сущность на стыке не потерялась.
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks, current = [], []
+    size = 0
+    for sentence in _sentences(text, max_chars):
+        if current and size + 1 + len(sentence) > max_chars:
+            chunks.append(" ".join(current))
+            overlap, overlap_size = [], 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) + 1 > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous) + 1
+            if overlap_size + len(sentence) > max_chars:
+                overlap, overlap_size = [], 0
+            current, size = overlap, overlap_size
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def entity_key(entity: dict) -> tuple:
+    """Ключ для поиска повторов сущности: имя без учёта регистра и пробелов плюс тип."""
+    return " ".join(str(entity.get("name", "")).split()).casefold(), entity.get("type")
+
+
+def merge_entities(results: list[dict]) -> dict:
+    """
+    Объединяет сущности кусков в порядке первого вхождения,
+    убирая повторы (в том числе из перекрытий) по имени и типу.
+    """
+    seen = set()
+    entities = []
+    for result in results:
+        for entity in result.get("entities", []):
+            key = entity_key(entity)
+            if key in seen:
+                continue
+            seen.add(key)
+            entities.append(entity)
+    return {"entities": entities}
@@ -1,8 +1,19 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import requests
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+import httpx
+import asyncio
+import hashlib
 import json
 import logging
+import os
+import redis.asyncio as redis
+
+import metrics
+from chunking import entity_key, merge_entities, split_text
+from metrics import stage
+from ner_cache import NERCache
+from stream_parser import EntityStreamParser
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +36,50 @@ class Entity(BaseModel):
 class EntitiesResponse(BaseModel):
     entities: list[Entity]
 
+class BatchTextRequest(BaseModel):
+    texts: list[str] = Field(min_length=1)
+    server_host: str = "http://localhost:8081"
+
+class BatchItemResponse(BaseModel):
+    entities: list[Entity] = []
+    error: str | None = None
+
+class BatchEntitiesResponse(BaseModel):
+    results: list[BatchItemResponse]
+
+# Сколько генераций одновременно отправляем на один сервер Ollama —
+# стоит выставить равным OLLAMA_NUM_PARALLEL на стороне сервера
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", 4))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 120))
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:27b")
+# Длинные статьи режутся на куски до NER_CHUNK_CHARS символов с перекрытием
+# NER_CHUNK_OVERLAP, куски извлекаются параллельно и сливаются
+NER_CHUNK_CHARS = int(os.getenv("NER_CHUNK_CHARS", 4000))
+NER_CHUNK_OVERLAP = int(os.getenv("NER_CHUNK_OVERLAP", 300))
+
+# Общий асинхронный клиент с keep-alive: соединения к Ollama переиспользуются
+http_client: httpx.AsyncClient | None = None
+host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+@app.on_event("startup")
+async def open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=OLLAMA_CONCURRENCY * 4,
+                            keepalive_expiry=60),
+    )
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+def get_host_semaphore(server_host: str) -> asyncio.Semaphore:
+    """Ограничивает число одновременных генераций на каждый сервер Ollama."""
+    if server_host not in host_semaphores:
+        host_semaphores[server_host] = asyncio.Semaphore(OLLAMA_CONCURRENCY)
+    return host_semaphores[server_host]
+
 SYSTEM_PROMPT = """
 ````markdown
 ### Системный промпт для NER‑модуля
@@ -97,32 +152,192 @@ SYSTEM_PROMPT = """
 
 """
 
-def extract_entities(text: str, server_host: str) -> dict:
+# Версия промпта входит в ключ кэша: изменение SYSTEM_PROMPT инвалидирует старые результаты
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# Кэш результатов в Redis (NER_CACHE=0 отключает). NER_NEAR_DUPLICATES=1 включает поиск
+# почти-дубликатов по MinHash со сходством по Жаккару от NER_NEAR_DUPLICATE_SIMILARITY
+ner_cache = None
+if os.getenv("NER_CACHE", "1") == "1":
+    ner_cache = NERCache(
+        redis.Redis(host=os.getenv("REDIS_HOST", "redis"), port=int(os.getenv("REDIS_PORT", 6379))),
+        OLLAMA_MODEL, PROMPT_VERSION,
+        ttl_hours=float(os.getenv("NER_CACHE_TTL_HOURS", 72)),
+        max_entries=int(os.getenv("NER_CACHE_MAX_ENTRIES", 100_000)),
+        near_duplicates=os.getenv("NER_NEAR_DUPLICATES", "0") == "1",
+        min_similarity=float(os.getenv("NER_NEAR_DUPLICATE_SIMILARITY", 0.8)),
+    )
+
+# Метрики Prometheus на GET /metrics; PROFILING=1 включает профиль запроса по ?profile=1
+metrics.instrument(app, *([metrics.NERCacheCollector(ner_cache)] if ner_cache is not None else ()))
+
+class EntityParseError(ValueError):
+    """Ответ модели не удалось разобрать как JSON с сущностями."""
+
+def parse_entities(result_text: str) -> dict:
+    """
+    Разбирает полный ответ модели. Сущности из массива "entities" разбираются
+    по одной, поэтому битый хвост ответа не уничтожает уже закрытые объекты.
+    """
+    parser = EntityStreamParser()
+    entities = parser.feed(result_text)
+    if parser.done or entities:
+        if not parser.done:
+            # Неполный результат отдаётся, но не кэшируется
+            logger.warning(f"Ответ модели оборван, сохранено сущностей: {len(entities)}")
+            return {"entities": entities, "partial": True}
+        return {"entities": entities}
+    # Найти JSON в ответе (если модель добавила текст до/после)
     try:
-        url = f"{server_host}/api/generate"
-        prompt = f"{SYSTEM_PROMPT}\n\nТекст: {text}\n"
-        payload = {
-            "model": "gemma3:27b",
-            "prompt": prompt,
-            "stream": False
-        }
-        response = requests.post(url, json=payload, timeout=120)
-        response.raise_for_status()
-        # Ollama возвращает {'response': '...'}
-        result_text = response.json().get('response', '')
-        # Найти JSON в ответе (если модель добавила текст до/после)
+        json_start = result_text.find('{')
+        json_end = result_text.rfind('}') + 1
+        json_str = result_text[json_start:json_end]
+        return json.loads(json_str)
+    except Exception as e:
+        logger.error(f"Ошибка парсинга JSON из ответа модели: {e}")
+        raise EntityParseError(str(e)) from e
+
+async def request_entities(text: str, server_host: str) -> dict:
+    """Запрашивает у Ollama сущности для текста; ошибки запроса и разбора пробрасываются."""
+    url = f"{server_host}/api/generate"
+    prompt = f"{SYSTEM_PROMPT}\n\nТекст: {text}\n"
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": False
+    }
+    # Время генерации включает ожидание очереди к серверу Ollama
+    with stage("generate"):
+        async with get_host_semaphore(server_host):
+            response = await http_client.post(url, json=payload)
+    response.raise_for_status()
+    # Ollama возвращает {'response': '...'}
+    with stage("parse"):
+        return parse_entities(response.json().get('response', ''))
+
+async def generate_chunk_entities(text: str, server_host: str) -> dict:
+    """Сущности куска текста из кэша или, при промахе, от Ollama."""
+    if ner_cache is None:
+        return await request_entities(text, server_host)
+    return await ner_cache.get_or_compute(text, lambda: request_entities(text, server_host))
+
+async def generate_entities(text: str, server_host: str) -> dict:
+    """
+    Сущности текста. Длинный текст делится на куски, которые извлекаются
+    параллельно; упавшие куски логируются, ошибка пробрасывается, только
+    если не удалось обработать ни один кусок.
+    """
+    with stage("chunk"):
+        chunks = split_text(text, NER_CHUNK_CHARS, NER_CHUNK_OVERLAP)
+    if len(chunks) == 1:
+        return await generate_chunk_entities(chunks[0], server_host)
+
+    results = await asyncio.gather(
+        *(generate_chunk_entities(chunk, server_host) for chunk in chunks), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    if len(errors) == len(results):
+        raise errors[0]
+    for error in errors:
+        logger.error(f"Ошибка извлечения сущностей из куска текста: {error}")
+    return merge_entities([result for result in results if not isinstance(result, Exception)])
+
+async def stream_ollama_entities(text: str, server_host: str, parser: EntityStreamParser):
+    """
+    Потоково генерирует ответ Ollama и отдаёт сущности по мере их закрытия.
+    Как только корневой массив "entities" закрыт, соединение закрывается,
+    и Ollama прекращает генерацию.
+    """
+    url = f"{server_host}/api/generate"
+    prompt = f"{SYSTEM_PROMPT}\n\nТекст: {text}\n"
+    payload = {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt,
+        "stream": True
+    }
+    with stage("generate_stream"):
+        async with get_host_semaphore(server_host):
+            async with http_client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                # Ollama присылает NDJSON: {'response': '<токены>', 'done': false}
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    for entity in parser.feed(chunk.get('response', '')):
+                        yield entity
+                    if parser.done or chunk.get('done'):
+                        break
+    if not parser.done and not parser.in_array:
+        raise EntityParseError("В ответе модели нет массива entities")
+
+async def stream_chunk_entities(text: str, server_host: str):
+    """Потоковые сущности куска текста: из кэша или от Ollama с сохранением в кэш."""
+    if ner_cache is not None:
+        cached = await ner_cache.lookup(text)
+        if cached is not None:
+            for entity in cached.get("entities", []):
+                yield entity
+            return
+
+    parser = EntityStreamParser()
+    entities = []
+    async for entity in stream_ollama_entities(text, server_host, parser):
+        entities.append(entity)
+        yield entity
+    if ner_cache is not None and parser.done:
+        await ner_cache.store(text, {"entities": entities})
+
+async def stream_entities(text: str, server_host: str):
+    """
+    Потоковые сущности текста без повторов, в порядке первого вхождения.
+    Куски длинного текста генерируются параллельно, но отдаются по порядку:
+    сущности следующего куска идут сразу после завершения предыдущего.
+    """
+    chunks = split_text(text, NER_CHUNK_CHARS, NER_CHUNK_OVERLAP)
+    queues = [asyncio.Queue() for _ in chunks]
+    done = object()
+
+    async def produce(chunk: str, queue: asyncio.Queue):
         try:
-            json_start = result_text.find('{')
-            json_end = result_text.rfind('}') + 1
-            json_str = result_text[json_start:json_end]
-            result = json.loads(json_str)
+            async for entity in stream_chunk_entities(chunk, server_host):
+                await queue.put(entity)
+            await queue.put(done)
         except Exception as e:
-            logger.error(f"Ошибка парсинга JSON из ответа модели: {e}")
-            result = {"entities": []}
-        return result
+            await queue.put(e)
+
+    tasks = [asyncio.create_task(produce(chunk, queue)) for chunk, queue in zip(chunks, queues)]
+    seen = set()
+    errors = []
+    try:
+        for queue in queues:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"Ошибка извлечения сущностей из куска текста: {item}")
+                    errors.append(item)
+                    break
+                key = entity_key(item)
+                if key not in seen:
+                    seen.add(key)
+                    yield item
+        if len(errors) == len(chunks):
+            raise errors[0]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def extract_entities(text: str, server_host: str) -> dict:
+    try:
+        result = await generate_entities(text, server_host)
     except Exception as e:
+        metrics.ERRORS.labels("single").inc()
         logger.error(f"Ошибка при обращении к Ollama: {str(e)}")
         return {"entities": []}
+    metrics.ENTITIES.labels("single").inc(len(result.get("entities", [])))
+    return result
 
 @app.post("/extract-entities", response_model=EntitiesResponse)
 async def api_extract_entities(request: TextRequest):
@@ -130,12 +345,54 @@ async def api_extract_entities(request: TextRequest):
     Извлекает именованные сущности из текста через Ollama
     """
     try:
-        result = extract_entities(request.text, request.server_host)
+        result = await extract_entities(request.text, request.server_host)
         return result
     except Exception as e:
         logger.exception("API error")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/extract-entities/batch", response_model=BatchEntitiesResponse)
+async def api_extract_entities_batch(request: BatchTextRequest):
+    """
+    Извлекает сущности из нескольких текстов параллельно (не больше
+    OLLAMA_CONCURRENCY генераций на сервер). Результаты идут в порядке
+    текстов, ошибка одного текста не роняет остальные.
+    """
+    async def extract_one(text: str) -> dict:
+        try:
+            result = await generate_entities(text, request.server_host)
+        except Exception as e:
+            metrics.ERRORS.labels("batch").inc()
+            logger.error(f"Ошибка при обращении к Ollama: {str(e)}")
+            return {"entities": [], "error": str(e) or type(e).__name__}
+        metrics.ENTITIES.labels("batch").inc(len(result.get("entities", [])))
+        return result
+
+    results = await asyncio.gather(*(extract_one(text) for text in request.texts))
+    return {"results": results}
+
+@app.post("/extract-entities/stream")
+async def api_extract_entities_stream(request: TextRequest):
+    """
+    Извлекает сущности потоково: каждая сущность отдаётся строкой NDJSON,
+    как только модель её сгенерировала. Ошибка передаётся строкой {"error": ...}.
+    """
+    async def lines():
+        try:
+            async for entity in stream_entities(request.text, request.server_host):
+                metrics.ENTITIES.labels("stream").inc()
+                yield json.dumps(entity, ensure_ascii=False) + "\n"
+        except Exception as e:
+            metrics.ERRORS.labels("stream").inc()
+            logger.error(f"Ошибка при потоковом извлечении сущностей: {str(e)}")
+            yield json.dumps({"error": str(e) or type(e).__name__}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return ner_cache.stats() if ner_cache is not None else {"enabled": False}
+
 if __name__ == "__main__":
     import uvicorn
     # uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,31 @@
+from prometheus_client import Counter
+from prometheus_client.core import CounterMetricFamily
+
+import service_metrics
+
+# Генерация Ollama занимает секунды, разбор ответа — доли миллисекунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+SERVICE = service_metrics.ServiceMetrics("ner", "Время этапов извлечения сущностей", LATENCY_BUCKETS)
+ENTITIES = Counter("ner_entities", "Извлечённые сущности", ["mode"])
+ERRORS = Counter("ner_errors", "Ошибки извлечения сущностей", ["mode"])
+
+
+class NERCacheCollector:
+    """Отдаёт статистику кэша результатов в момент опроса."""
+
+    def __init__(self, ner_cache):
+        self.ner_cache = ner_cache
+
+    def collect(self):
+        stats = self.ner_cache.stats()
+        lookups = CounterMetricFamily("ner_cache_lookups", "Поиски в кэше результатов", labels=["result"])
+        lookups.add_metric(["hit"], stats["hits"])
+        lookups.add_metric(["near_duplicate_hit"], stats["near_duplicate_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+
+
+# Общие для сервисов таймер этапов и подключение метрик к приложению
+stage = SERVICE.stage
+instrument = SERVICE.instrument
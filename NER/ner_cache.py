@@ -0,0 +1,214 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+MINHASH_ROWS = MINHASH_PERMUTATIONS // MINHASH_BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Параметры хэш-функций (a * x + b) mod p, фиксированные, чтобы подписи
+# совпадали между процессами и перезапусками
+_rng = random.Random(20240601)
+MINHASH_PARAMS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+
+def normalize_text(text: str) -> str:
+    """NFKC и схлопывание пробелов: тексты, отличающиеся только разметкой пробелов, совпадают."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+@functools.lru_cache(maxsize=1024)
+def minhash(text: str, shingle: int = 3) -> tuple[int, ...]:
+    """MinHash-подпись текста по шинглам из shingle слов (кэшируется: поиск и запись считают её один раз)."""
+    words = WORD_RE.findall(text.lower())
+    shingles = {" ".join(words[i:i + shingle]) for i in range(max(len(words) - shingle + 1, 1))}
+    hashes = [
+        int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        for item in shingles
+    ]
+    return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in MINHASH_PARAMS)
+
+
+def similarity(left, right) -> float:
+    """Оценка коэффициента Жаккара по двум MinHash-подписям."""
+    return sum(x == y for x, y in zip(left, right)) / len(left)
+
+
+class NERCache:
+    """
+    Кэш результатов извлечения сущностей в Redis.
+
+    Ключ — хэш нормализованного текста, модели и версии промпта. Записи
+    живут ttl_hours и вытесняются по времени вставки, когда их больше
+    max_entries. При near_duplicates=True для каждого текста хранится
+    MinHash-подпись и её LSH-полосы (MINHASH_BANDS по MINHASH_ROWS значений):
+    кандидаты ищутся по совпадению хотя бы одной полосы и проверяются оценкой
+    Жаккара не ниже min_similarity, так что перепосты с мелкими правками
+    находятся за пару запросов к Redis.
+    Ошибки Redis не ломают извлечение — кэш просто пропускается.
+    """
+
+    def __init__(self, redis_client, model: str, prompt_version: str, ttl_hours: float = 72,
+                 max_entries: int = 100_000, near_duplicates: bool = False, min_similarity: float = 0.8,
+                 prefix: str = "ner:"):
+        self.redis = redis_client
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl = int(ttl_hours * 3600)
+        self.max_entries = max_entries
+        self.near_duplicates = near_duplicates
+        self.min_similarity = min_similarity
+        self.prefix = prefix
+        self.index_key = f"{prefix}results"
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model}\0{self.prompt_version}\0{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _result_key(self, key: str) -> str:
+        return f"{self.prefix}result:{key}"
+
+    def _signature_key(self, key: str) -> str:
+        return f"{self.prefix}minhash:{key}"
+
+    def _band_keys(self, signature: tuple[int, ...]) -> list[str]:
+        keys = []
+        for band in range(MINHASH_BANDS):
+            rows = signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+            digest = hashlib.blake2b(",".join(map(str, rows)).encode(), digest_size=8).hexdigest()
+            keys.append(f"{self.prefix}lsh:{self.model}:{self.prompt_version}:{band}:{digest}")
+        return keys
+
+    async def _lookup(self, key: str, signature: tuple[int, ...] | None):
+        cached = await self.redis.get(self._result_key(key))
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+        if signature is None:
+            return None
+
+        pipe = self.redis.pipeline(transaction=False)
+        for band_key in self._band_keys(signature):
+            pipe.smembers(band_key)
+        candidates = [c.decode() if isinstance(c, bytes) else c for c in set().union(*await pipe.execute())]
+        if not candidates:
+            return None
+
+        pipe = self.redis.pipeline(transaction=False)
+        for candidate in candidates:
+            pipe.get(self._signature_key(candidate))
+        best_key, best_similarity = None, self.min_similarity
+        for candidate, stored in zip(candidates, await pipe.execute()):
+            if stored is None:
+                continue
+            score = similarity(signature, json.loads(stored))
+            if score >= best_similarity:
+                best_key, best_similarity = candidate, score
+        if best_key is None:
+            return None
+        cached = await self.redis.get(self._result_key(best_key))
+        if cached is not None:
+            self.near_hits += 1
+            return json.loads(cached)
+        return None
+
+    async def _store(self, key: str, signature: tuple[int, ...] | None, result: dict):
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._result_key(key), json.dumps(result, ensure_ascii=False), ex=self.ttl)
+        pipe.zadd(self.index_key, {key: now})
+        # Записи старше TTL уже истекли — убираем их из индекса
+        pipe.zremrangebyscore(self.index_key, "-inf", now - self.ttl)
+        if signature is not None:
+            pipe.set(self._signature_key(key), json.dumps(signature), ex=self.ttl)
+            for band_key in self._band_keys(signature):
+                pipe.sadd(band_key, key)
+                pipe.expire(band_key, self.ttl)
+        pipe.zcard(self.index_key)
+        size = (await pipe.execute())[-1]
+
+        if size > self.max_entries:
+            evicted = await self.redis.zpopmin(self.index_key, size - self.max_entries)
+            if evicted:
+                evicted = [k.decode() if isinstance(k, bytes) else k for k, _ in evicted]
+                await self.redis.delete(*[self._result_key(k) for k in evicted],
+                                        *[self._signature_key(k) for k in evicted])
+
+    async def lookup(self, text: str):
+        """Результат для text (или его почти-дубликата) либо None; ошибки Redis глотаются."""
+        signature = minhash(normalize_text(text)) if self.near_duplicates else None
+        try:
+            cached = await self._lookup(self.key(text), signature)
+        except Exception as e:
+            logger.warning(f"NER cache lookup failed: {e}")
+            cached = None
+        if cached is None:
+            self.misses += 1
+        return cached
+
+    async def store(self, text: str, result: dict):
+        """Сохраняет результат для text; ошибки Redis глотаются."""
+        signature = minhash(normalize_text(text)) if self.near_duplicates else None
+        try:
+            await self._store(self.key(text), signature, result)
+        except Exception as e:
+            logger.warning(f"NER cache store failed: {e}")
+
+    async def get_or_compute(self, text: str, compute):
+        """
+        Возвращает закэшированный результат для text или вычисляет его через
+        compute() и сохраняет. Результат с "partial": True (оборванный ответ
+        модели) не сохраняется. Одинаковые тексты, пришедшие одновременно,
+        ждут одну генерацию.
+        """
+        key = self.key(text)
+        if key in self._inflight:
+            self.hits += 1
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            cached = await self.lookup(text)
+            if cached is None:
+                cached = await compute()
+                if not cached.get("partial"):
+                    await self.store(text, cached)
+            future.set_result(cached)
+            return cached
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение уже отдано вызывающему; помечаем его полученным, даже если ждущих нет
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / total if total else 0.0,
+        }
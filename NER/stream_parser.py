@@ -0,0 +1,93 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+ENTITIES_START_RE = re.compile(r'"entities"\s*:\s*\[')
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+class EntityStreamParser:
+    """
+    Инкрементальный разбор ответа модели.
+
+    Текст подаётся кусками по мере генерации; каждый объект внутри
+    корневого массива "entities" отдаётся, как только закрывается его
+    фигурная скобка. После закрытия массива done становится True —
+    дальше генерацию можно останавливать. Битый объект пропускается,
+    не ломая остальные.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.object_start = None
+
+    def feed(self, text: str) -> list[dict]:
+        """Добавляет кусок ответа и возвращает сущности, закрывшиеся в нём."""
+        if self.done:
+            return []
+        self.buffer += text
+        if not self.in_array:
+            match = ENTITIES_START_RE.search(self.buffer)
+            if match is None:
+                return []
+            self.in_array = True
+            self.pos = match.end()
+
+        entities = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.object_start = self.pos
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    if char == "]":
+                        self.done = True
+                        self.pos += 1
+                        break
+                else:
+                    self.depth -= 1
+                    if self.depth == 0 and self.object_start is not None:
+                        entity = self._load(self.buffer[self.object_start:self.pos + 1])
+                        if entity is not None:
+                            entities.append(entity)
+                        self.object_start = None
+            self.pos += 1
+
+        # Разобранный префикс больше не нужен
+        keep_from = self.object_start if self.object_start is not None else self.pos
+        self.buffer = self.buffer[keep_from:]
+        self.pos -= keep_from
+        if self.object_start is not None:
+            self.object_start = 0
+        return entities
+
+    @staticmethod
+    def _load(raw: str):
+        for candidate in (raw, TRAILING_COMMA_RE.sub(r"\1", raw)):
+            try:
+                entity = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entity, dict) and "name" in entity and "type" in entity:
+                return entity
+        logger.warning(f"Пропущена некорректная сущность в ответе модели: {raw[:200]}")
+        return None
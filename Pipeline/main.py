@@ -0,0 +1,183 @@
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+import httpx
+import asyncio
+import json
+import logging
+import os
+import socket
+import redis.asyncio as redis
+
+from streams import StreamStage
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(
+    title="TrendCore Ingest Pipeline",
+    description="Конвейер статья → NER → матчинг → детекция трендов на Redis Streams",
+)
+
+class Article(BaseModel):
+    id: str | None = None
+    text: str
+    published_at: float | None = None  # unix-время; по умолчанию — время обработки
+
+class ArticlesRequest(BaseModel):
+    articles: list[Article] = Field(min_length=1)
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+NER_URL = os.getenv("NER_URL", "http://ner:6000")
+MATCHING_URL = os.getenv("MATCHING_URL", "http://entity_matching_service:7000")
+PREDICTION_URL = os.getenv("PREDICTION_URL", "http://prediction:6000")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://ollama:11434")
+TREND_DETECTOR = os.getenv("TREND_DETECTOR", "daily")
+HTTP_TIMEOUT = float(os.getenv("PIPELINE_HTTP_TIMEOUT", 300))
+
+# Очереди между этапами
+ARTICLES_STREAM = "pipeline:articles"
+ENTITIES_STREAM = "pipeline:entities"
+MATCHES_STREAM = "pipeline:matches"
+TRENDS_STREAM = "pipeline:trends"
+DEAD_LETTER_STREAM = "pipeline:dead"
+# Сколько последних смен статуса трендов хранить для потребителей
+TRENDS_MAXLEN = int(os.getenv("PIPELINE_TRENDS_MAXLEN", 100_000))
+
+# Больше PIPELINE_MAX_BACKLOG записей в очереди — предыдущий этап ждёт,
+# а приём статей отвечает 429
+MAX_BACKLOG = int(os.getenv("PIPELINE_MAX_BACKLOG", 10_000))
+# Запись, не подтверждённая за PIPELINE_CLAIM_IDLE_MS, забирается повторно;
+# генерация LLM долгая, поэтому по умолчанию 5 минут
+CLAIM_IDLE_MS = int(os.getenv("PIPELINE_CLAIM_IDLE_MS", 300_000))
+MAX_DELIVERIES = int(os.getenv("PIPELINE_MAX_DELIVERIES", 5))
+
+redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+http_client: httpx.AsyncClient | None = None
+workers: list[asyncio.Task] = []
+
+
+async def post_json(url: str, payload: dict) -> dict:
+    response = await http_client.post(url, json=payload)
+    response.raise_for_status()
+    return response.json()
+
+
+async def extract_entities(articles: list[dict]) -> list:
+    """Пачка статей — один запрос /extract-entities/batch; ошибка статьи — повтор только её."""
+    response = await post_json(f"{NER_URL}/extract-entities/batch",
+                               {"texts": [article["text"] for article in articles], "server_host": OLLAMA_HOST})
+    results = []
+    for article, item in zip(articles, response["results"]):
+        if item.get("error"):
+            results.append(RuntimeError(item["error"]))
+        else:
+            results.append([{"id": article.get("id"), "published_at": article.get("published_at"),
+                             "entities": item["entities"]}])
+    return results
+
+
+async def match_entities(items: list[dict]) -> list:
+    """
+    Сущности всех статей пачки сопоставляются с кластерами одним запросом
+    /match. Повторы имени убираются только внутри статьи: /match считает
+    упоминания для популярности, и кластер из N статей должен получить N,
+    как и в detect_trends.
+    """
+    article_names = [list(dict.fromkeys(entity["name"] for entity in item["entities"])) for item in items]
+    names = [name for item_names in article_names for name in item_names]
+    cluster_of = {}
+    if names:
+        response = await post_json(f"{MATCHING_URL}/match", {"entities": names})
+        for cluster_id, members in response["clusters"].items():
+            for name in members:
+                cluster_of[name] = cluster_id
+
+    results = []
+    for item, item_names in zip(items, article_names):
+        clusters = {}
+        for name in item_names:
+            clusters.setdefault(cluster_of[name], []).append(name)
+        results.append([{"id": item["id"], "published_at": item["published_at"], "clusters": clusters}])
+    return results
+
+
+async def detect_trends(items: list[dict]) -> list:
+    """
+    Упоминания кластеров из пачки уходят в потоковый детектор Prediction
+    Service одним запросом; дальше публикуются только смены статуса бума.
+    """
+    updates = [
+        {"entity": cluster_id, "count": len(names), "timestamp": item["published_at"]}
+        for item in items for cluster_id, names in item["clusters"].items()
+    ]
+    changed = {}
+    if updates:
+        response = await post_json(f"{PREDICTION_URL}/stream/{TREND_DETECTOR}/update", {"updates": updates})
+        changed = response["changed"]
+    trends = [{"cluster_id": cluster_id, "is_boom": is_boom} for cluster_id, is_boom in changed.items()]
+    # Смены статуса относятся ко всей пачке — публикуем их вместе с последней записью
+    return [[] for _ in items[:-1]] + [trends]
+
+
+def stage(name, source, handler, target, batch_env, default_batch, **kwargs):
+    options = {"max_backlog": MAX_BACKLOG, **kwargs}
+    return StreamStage(
+        redis_client, name, source, handler, target,
+        batch_size=int(os.getenv(batch_env, default_batch)),
+        claim_idle_ms=CLAIM_IDLE_MS, max_deliveries=MAX_DELIVERIES, dead_letter=DEAD_LETTER_STREAM, **options,
+    )
+
+# Каждый этап масштабируется отдельно: число обработчиков в процессе задаётся
+# *_WORKERS, а несколько контейнеров делят работу через общие consumer groups.
+# NER — узкое место, поэтому по умолчанию у него больше обработчиков и меньше пачки
+STAGES = {
+    "ner": (stage("ner", ARTICLES_STREAM, extract_entities, ENTITIES_STREAM, "NER_BATCH", 4),
+            int(os.getenv("NER_WORKERS", 4))),
+    "match": (stage("match", ENTITIES_STREAM, match_entities, MATCHES_STREAM, "MATCH_BATCH", 64),
+              int(os.getenv("MATCH_WORKERS", 1))),
+    # Ленту трендов никто не разбирает через consumer group, поэтому она не
+    # тормозит детекцию, а обрезается по длине
+    "detect": (stage("detect", MATCHES_STREAM, detect_trends, TRENDS_STREAM, "DETECT_BATCH", 256,
+                     max_backlog=0, target_maxlen=TRENDS_MAXLEN),
+               int(os.getenv("DETECT_WORKERS", 1))),
+}
+
+
+@app.on_event("startup")
+async def start_workers():
+    global http_client
+    http_client = httpx.AsyncClient(timeout=httpx.Timeout(HTTP_TIMEOUT, connect=10.0))
+    host = socket.gethostname()
+    for name, (stream_stage, count) in STAGES.items():
+        for i in range(count):
+            workers.append(asyncio.create_task(stream_stage.run(f"{host}-{name}-{i}")))
+    logger.info("Запущены обработчики: " + ", ".join(f"{name}={count}" for name, (_, count) in STAGES.items()))
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await http_client.aclose()
+    await redis_client.aclose()
+
+
+@app.post("/articles")
+async def ingest_articles(request: ArticlesRequest):
+    """Ставит статьи в очередь; при переполненной очереди отвечает 429 — стоит повторить позже."""
+    if await redis_client.xlen(ARTICLES_STREAM) >= MAX_BACKLOG:
+        raise HTTPException(status_code=429, detail="Очередь статей переполнена")
+    pipe = redis_client.pipeline(transaction=False)
+    for article in request.articles:
+        pipe.xadd(ARTICLES_STREAM, {"data": json.dumps(article.model_dump(), ensure_ascii=False)})
+    return {"queued": await pipe.execute()}
+
+
+@app.get("/pipeline/stats")
+async def pipeline_stats():
+    stats = {name: await stream_stage.stats() for name, (stream_stage, _) in STAGES.items()}
+    stats["trends"] = {"length": await redis_client.xlen(TRENDS_STREAM)}
+    stats["dead"] = {"length": await redis_client.xlen(DEAD_LETTER_STREAM)}
+    return stats
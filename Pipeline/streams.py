@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Пауза, пока следующий этап разбирает накопившуюся очередь
+BACKPRESSURE_SLEEP = 0.5
+
+
+class StreamStage:
+    """
+    Этап конвейера поверх Redis Streams.
+
+    Читает пачки записей из source через consumer group, отдаёт их
+    handler и публикует результаты в target. Публикация, XACK и XDEL
+    обработанных записей идут одной транзакцией, так что в source остаётся
+    только необработанное и XLEN — это очередь этапа. Пока очередь target
+    не меньше max_backlog, этап не читает новые записи (backpressure).
+    Если target никто не разбирает, вместо этого задаётся target_maxlen —
+    тогда target обрезается до примерно такой длины.
+
+    handler(payloads) возвращает список той же длины: для каждой записи —
+    список выходных сообщений или исключение. Записи с исключением, как и
+    вся пачка при ошибке handler, остаются в pending и через claim_idle_ms
+    забираются повторно (at-least-once). Handler получает запись не больше
+    max_deliveries раз: следующая доставка (times_delivered в Redis станет
+    max_deliveries + 1) уже не обрабатывается, а переносит запись в dead_letter.
+    """
+
+    def __init__(self, redis_client, name: str, source: str, handler, target: str | None = None,
+                 batch_size: int = 16, block_ms: int = 1000, max_backlog: int = 10_000,
+                 claim_idle_ms: int = 60_000, max_deliveries: int = 5, dead_letter: str = "pipeline:dead",
+                 target_maxlen: int | None = None):
+        self.redis = redis_client
+        self.name = name
+        self.source = source
+        self.handler = handler
+        self.target = target
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.max_backlog = max_backlog
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.dead_letter = dead_letter
+        self.target_maxlen = target_maxlen
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(self.source, self.name, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def wait_for_capacity(self):
+        while self.target and self.max_backlog and await self.redis.xlen(self.target) >= self.max_backlog:
+            await asyncio.sleep(BACKPRESSURE_SLEEP)
+
+    async def _claim(self, consumer: str) -> list:
+        """Забирает записи, зависшие в pending дольше claim_idle_ms (сбой или падение обработчика)."""
+        claimed = await self.redis.xautoclaim(self.source, self.name, consumer, self.claim_idle_ms,
+                                              start_id="0-0", count=self.batch_size)
+        entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+        if not entries:
+            return []
+        pending = await self.redis.xpending_range(self.source, self.name, min=entries[0][0], max=entries[-1][0],
+                                                  count=len(entries), consumername=consumer)
+        deliveries = {item["message_id"]: item["times_delivered"] for item in pending}
+
+        retry, dead = [], []
+        for entry_id, fields in entries:
+            # times_delivered учитывает и эту доставку, ещё не обработанную
+            (dead if deliveries.get(entry_id, 0) > self.max_deliveries else retry).append((entry_id, fields))
+        if dead:
+            pipe = self.redis.pipeline(transaction=True)
+            for entry_id, fields in dead:
+                pipe.xadd(self.dead_letter, {"stage": self.name, "source_id": entry_id, **fields})
+            ids = [entry_id for entry_id, _ in dead]
+            pipe.xack(self.source, self.name, *ids)
+            pipe.xdel(self.source, *ids)
+            await pipe.execute()
+            self.dead += len(dead)
+            logger.error(f"{self.name}: {len(dead)} записей отправлены в {self.dead_letter} после {self.max_deliveries} попыток обработки")
+        self.retried += len(retry)
+        return retry
+
+    async def _read(self, consumer: str) -> list:
+        response = await self.redis.xreadgroup(self.name, consumer, {self.source: ">"},
+                                               count=self.batch_size, block=self.block_ms)
+        return response[0][1] if response else []
+
+    async def _process(self, entries: list):
+        payloads = [json.loads(fields["data"]) for _, fields in entries]
+        try:
+            results = await self.handler(payloads)
+        except Exception as e:
+            self.failed += len(entries)
+            logger.warning(f"{self.name}: пачка из {len(entries)} записей не обработана, будет повтор: {e}")
+            return
+
+        done = []
+        pipe = self.redis.pipeline(transaction=True)
+        for (entry_id, _), result in zip(entries, results):
+            if isinstance(result, Exception):
+                self.failed += 1
+                logger.warning(f"{self.name}: запись {entry_id} не обработана, будет повтор: {result}")
+                continue
+            if self.target:
+                for message in result:
+                    pipe.xadd(self.target, {"data": json.dumps(message, ensure_ascii=False)},
+                              maxlen=self.target_maxlen, approximate=True)
+            done.append(entry_id)
+        if done:
+            pipe.xack(self.source, self.name, *done)
+            pipe.xdel(self.source, *done)
+            await pipe.execute()
+            self.processed += len(done)
+
+    async def run(self, consumer: str):
+        """Цикл одного обработчика; обработчиков этапа может быть сколько угодно, в том числе в разных процессах."""
+        await self.ensure_group()
+        while True:
+            try:
+                await self.wait_for_capacity()
+                entries = await self._claim(consumer) or await self._read(consumer)
+                if entries:
+                    await self._process(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"{self.name}/{consumer}: {e}")
+                await asyncio.sleep(1)
+
+    async def stats(self) -> dict:
+        pending = await self.redis.xpending(self.source, self.name)
+        return {
+            "queue": await self.redis.xlen(self.source),
+            "pending": pending["pending"],
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули конвейера лежат рядом с main.py, а не в пакете
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+
+import pytest
+import redis.asyncio as redis
+
+from streams import StreamStage
+
+# Тесты пишут в отдельную базу: REDIS_TEST_URL, по умолчанию локальный Redis, db 15
+REDIS_TEST_URL = os.getenv("REDIS_TEST_URL", "redis://localhost:6379/15")
+
+
+async def run_failing_stage(max_deliveries: int, steps: int):
+    client = redis.Redis.from_url(REDIS_TEST_URL, decode_responses=True)
+    try:
+        await client.ping()
+    except redis.ConnectionError:
+        await client.aclose()
+        pytest.skip(f"Redis недоступен по {REDIS_TEST_URL}")
+    await client.flushdb()
+    calls = []
+
+    async def handler(payloads):
+        calls.append(payloads)
+        return [RuntimeError("сбой") for _ in payloads]
+
+    stage = StreamStage(client, "test", "test:source", handler, claim_idle_ms=0,
+                        max_deliveries=max_deliveries, dead_letter="test:dead", block_ms=10)
+    await stage.ensure_group()
+    await client.xadd("test:source", {"data": json.dumps({"n": 1})})
+    for _ in range(steps):
+        entries = await stage._claim("c") or await stage._read("c")
+        if entries:
+            await stage._process(entries)
+    dead = await client.xrange("test:dead")
+    queue = await client.xlen("test:source")
+    await client.flushdb()
+    await client.aclose()
+    return calls, dead, queue, stage
+
+
+@pytest.mark.parametrize("max_deliveries", [1, 3])
+def test_handler_sees_entry_max_deliveries_times(max_deliveries):
+    calls, dead, queue, stage = asyncio.run(run_failing_stage(max_deliveries, max_deliveries + 3))
+    assert len(calls) == max_deliveries
+    assert len(dead) == 1 and dead[0][1]["stage"] == "test"
+    assert queue == 0
+    assert stage.dead == 1 and stage.failed == max_deliveries
+
+
+def test_entry_stays_pending_before_last_attempt():
+    calls, dead, queue, _ = asyncio.run(run_failing_stage(3, 3))
+    assert len(calls) == 3
+    assert dead == [] and queue == 1
@@ -0,0 +1,74 @@
+"""
+Проверка и бенчмарк пакетного детектора бумов.
+
+Сначала на случайных рядах (включая нули, равные соседние дни, резкие
+скачки и крупные значения) сверяет boom_trend_batch с поэлементным
+is_boom_trend для разных sensitivity, затем меряет пропускную способность
+обеих версий.
+
+Пример:
+    python bench_detect.py --rows 100000 --checks 20000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from main import boom_trend_batch, is_boom_trend, WINDOW
+
+
+def random_series(rng, rows):
+    """Ряды из нескольких режимов, чтобы задеть все ветки условий."""
+    kind = rng.integers(0, 4, rows)
+    small = rng.integers(0, 5, (rows, WINDOW))
+    regular = rng.integers(0, 100, (rows, WINDOW))
+    spikes = regular.copy()
+    spikes[:, -1] *= rng.integers(1, 10, rows)
+    growing = np.sort(rng.integers(0, 200, (rows, WINDOW)), axis=1)
+    series = np.select(
+        [kind[:, None] == 0, kind[:, None] == 1, kind[:, None] == 2],
+        [small, regular, spikes], growing,
+    )
+    return series.astype(np.int64)
+
+
+def check_equivalence(rng, rows):
+    sensitivities = [0.5, 0.79, 0.8, 1.0, 1.19, 1.2, 2.0, 3.7]
+    series = random_series(rng, rows)
+    for sensitivity in sensitivities:
+        batch, _ = boom_trend_batch(series, sensitivity)
+        scalar = np.array([is_boom_trend(row.tolist(), sensitivity) for row in series], dtype=bool)
+        mismatches = np.flatnonzero(batch != scalar)
+        if len(mismatches):
+            row = series[mismatches[0]].tolist()
+            raise AssertionError(f"sensitivity={sensitivity}: {row} -> batch {batch[mismatches[0]]}, scalar {scalar[mismatches[0]]}")
+    print(f"✅ boom_trend_batch совпадает с is_boom_trend на {rows} рядах × {len(sensitivities)} sensitivity")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--checks", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    check_equivalence(rng, args.checks)
+
+    series = random_series(rng, args.rows)
+    rows_list = series.tolist()
+    started = time.perf_counter()
+    for row in rows_list:
+        is_boom_trend(row)
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    boom_trend_batch(series)
+    batch_time = time.perf_counter() - started
+
+    print(f"is_boom_trend:    {args.rows / scalar_time:>14,.0f} рядов/с")
+    print(f"boom_trend_batch: {args.rows / batch_time:>14,.0f} рядов/с ({scalar_time / batch_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
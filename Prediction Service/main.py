@@ -1,7 +1,12 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, confloat
-from typing import List, Annotated # <-- Добавлено Annotated
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, Field, ValidationError, confloat, conint
+from typing import List, Annotated, Optional # <-- Добавлено Annotated
 import numpy as np
+import os
+
+import metrics
+from metrics import stage
+from streaming import StreamingTrendDetector
 
 app = FastAPI(title="Boom Trend Detector")
 
@@ -10,6 +15,42 @@ class TrendRequest(BaseModel):
     daily_counts: Annotated[List[int], Field(min_length=7, max_length=7)]
     sensitivity: confloat(gt=0) = 1.0
 
+# Пакетные ряды считаются в int64: большие значения отклоняются валидацией, а не падают в NumPy
+Int64 = conint(ge=-2**63, le=2**63 - 1)
+
+class BatchTrendRequest(BaseModel):
+    daily_counts: List[Annotated[List[Int64], Field(min_length=7, max_length=7)]]
+    sensitivity: confloat(gt=0) = 1.0
+
+class StreamUpdate(BaseModel):
+    entity: str
+    count: int
+    timestamp: Optional[float] = None  # unix-время; по умолчанию — сейчас
+    increment: bool = True             # False — count это итог периода целиком
+
+class StreamUpdateRequest(BaseModel):
+    updates: List[StreamUpdate]
+
+class StreamSeedRequest(BaseModel):
+    entity: str
+    counts: Annotated[List[int], Field(min_length=1)]
+    timestamp: Optional[float] = None
+
+WINDOW = 7
+
+# Потоковые детекторы: "имя:окно:длина периода в секундах" через запятую,
+# например "daily:7:86400,hourly:24:3600"
+STREAM_DETECTORS = os.getenv("STREAM_DETECTORS", "daily:7:86400")
+STREAM_SENSITIVITY = float(os.getenv("STREAM_SENSITIVITY", 1.0))
+
+detectors = {}
+for spec in STREAM_DETECTORS.split(","):
+    name, window, period_seconds = spec.strip().split(":")
+    detectors[name] = StreamingTrendDetector(int(window), int(period_seconds), STREAM_SENSITIVITY)
+
+# Метрики Prometheus на GET /metrics; PROFILING=1 включает профиль запроса по ?profile=1
+metrics.instrument(app, metrics.DetectorCollector(detectors))
+
 def is_boom_trend(daily_counts, sensitivity=1.0):
     """
     Определяет, является ли временной ряд трендом "бум" на основе статистических правил.
@@ -40,12 +81,120 @@ def is_boom_trend(daily_counts, sensitivity=1.0):
     threshold = 4 if sensitivity < 0.8 else 3 if sensitivity < 1.2 else 2
     return 1 if score >= threshold else 0
 
+def boom_trend_batch(daily_counts, sensitivity=1.0):
+    """
+    Векторная версия is_boom_trend для матрицы N×7: те же пять условий,
+    балл и порог, посчитанные NumPy сразу по всем рядам.
+    Возвращает (is_boom, score) — массивы длины N.
+    """
+    days = np.asarray(daily_counts)
+    if days.ndim != 2 or days.shape[1] != WINDOW:
+        raise ValueError(f"Ожидается матрица N×{WINDOW}, получено {days.shape}")
+    last_day = days[:, -1]
+    prev_day = days[:, -2]
+    max_prev = days[:, :-1].max(axis=1)
+    mean_val = days.mean(axis=1)
+    std_dev = days.std(axis=1)
+    mean_3day = days[:, -4:-1].mean(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth_rate_1day = np.where(prev_day > 0, last_day / prev_day, 1)
+        growth_rate_3day = np.where(mean_3day > 0, last_day / mean_3day, 1)
+
+    sharp_jump = last_day > (2.5 * max_prev * sensitivity)
+    statistical_outlier = last_day > (mean_val + 2.5 * std_dev) * sensitivity
+    high_growth = (growth_rate_1day > 1.8) & (last_day > 30)
+    sustained_growth = (growth_rate_3day > 1.6) & (last_day > prev_day) & (prev_day > days[:, -3])
+    absolute_threshold = last_day > 50
+
+    score = (3 * sharp_jump + 2 * statistical_outlier + 2 * high_growth
+             + sustained_growth.astype(np.int64) + absolute_threshold)
+    threshold = 4 if sensitivity < 0.8 else 3 if sensitivity < 1.2 else 2
+    return score >= threshold, score
+
 @app.post("/detect")
 def detect_trend(req: TrendRequest):
     try:
-        result = is_boom_trend(req.daily_counts, req.sensitivity)
+        with stage("detect"):
+            result = is_boom_trend(req.daily_counts, req.sensitivity)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except IndexError as e: # Добавим обработку IndexError на случай недостаточных данных
         raise HTTPException(status_code=400, detail=f"Недостаточно данных для анализа тренда: {e}")
+    metrics.SERIES.labels("single").inc()
+    if result:
+        metrics.BOOMS.labels("single").inc()
     return {"is_boom": bool(result)}
+
+@app.post("/detect/batch")
+async def detect_trend_batch(request: Request, sensitivity: float = 1.0):
+    """
+    Пакетная проверка рядов на бум.
+
+    JSON: {"daily_counts": [[...7 чисел], ...], "sensitivity": 1.0} —
+    ответ {"is_boom": [...], "score": [...]}.
+    application/octet-stream: N×7 little-endian int64 подряд, sensitivity
+    в query-параметре — ответ N байт (1 — бум, 0 — нет).
+    """
+    body = await request.body()
+    binary = request.headers.get("content-type", "").startswith("application/octet-stream")
+    if binary:
+        if sensitivity <= 0:
+            raise HTTPException(status_code=400, detail="sensitivity должна быть больше 0")
+        if len(body) % (WINDOW * 8):
+            raise HTTPException(status_code=400, detail=f"Длина тела должна быть кратна {WINDOW * 8} байтам")
+        counts = np.frombuffer(body, dtype="<i8").reshape(-1, WINDOW)
+    else:
+        try:
+            req = BatchTrendRequest.model_validate_json(body)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+        counts = np.array(req.daily_counts, dtype=np.int64).reshape(-1, WINDOW)
+        sensitivity = req.sensitivity
+
+    with stage("detect_batch"):
+        is_boom, score = boom_trend_batch(counts, sensitivity)
+    metrics.SERIES.labels("batch").inc(len(is_boom))
+    metrics.BOOMS.labels("batch").inc(int(is_boom.sum()))
+    if binary:
+        return Response(content=is_boom.astype(np.uint8).tobytes(), media_type="application/octet-stream")
+    return {"is_boom": is_boom.tolist(), "score": score.tolist()}
+
+def get_detector(name: str) -> StreamingTrendDetector:
+    detector = detectors.get(name)
+    if detector is None:
+        raise HTTPException(status_code=404, detail=f"Детектор {name} не настроен")
+    return detector
+
+@app.post("/stream/{name}/update")
+def stream_update(name: str, req: StreamUpdateRequest):
+    """
+    Принимает новые счётчики или приращения за текущий период и
+    возвращает только сущности, у которых сменился статус бума.
+    """
+    detector = get_detector(name)
+    changed = {}
+    with stage("stream_update"):
+        for update in req.updates:
+            status = detector.update(update.entity, update.count, update.timestamp, update.increment)
+            if status is not None:
+                changed[update.entity] = status
+    for status in changed.values():
+        metrics.STATUS_CHANGES.labels(name, str(status).lower()).inc()
+    return {"changed": changed}
+
+@app.post("/stream/{name}/seed")
+def stream_seed(name: str, req: StreamSeedRequest):
+    """Заполняет окно сущности историей (последний элемент — текущий период)."""
+    return {"is_boom": get_detector(name).seed(req.entity, req.counts, req.timestamp)}
+
+@app.get("/stream/{name}/changes")
+def stream_changes(name: str):
+    """Сущности, сменившие статус с прошлого опроса (опрос их сбрасывает)."""
+    return {"changed": get_detector(name).drain_changes()}
+
+@app.get("/stream/{name}/entities/{entity}")
+def stream_entity(name: str, entity: str):
+    state = get_detector(name).get(entity)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Нет данных по сущности {entity}")
+    return state
@@ -0,0 +1,32 @@
+from prometheus_client import Counter
+from prometheus_client.core import GaugeMetricFamily
+
+import service_metrics
+
+# Детекция одного ряда — микросекунды, большой пакет — до секунды
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+SERVICE = service_metrics.ServiceMetrics("prediction", "Время этапов детекции", LATENCY_BUCKETS)
+SERIES = Counter("prediction_series_checked", "Проверенные ряды", ["mode"])
+BOOMS = Counter("prediction_booms", "Ряды, признанные бумом", ["mode"])
+STATUS_CHANGES = Counter("prediction_stream_status_changes", "Смены статуса бума в потоковых детекторах",
+                         ["detector", "is_boom"])
+
+
+class DetectorCollector:
+    """Число отслеживаемых сущностей в каждом потоковом детекторе на момент опроса."""
+
+    def __init__(self, detectors: dict):
+        self.detectors = detectors
+
+    def collect(self):
+        entities = GaugeMetricFamily("prediction_stream_entities", "Сущности в потоковом детекторе",
+                                     labels=["detector"])
+        for name, detector in self.detectors.items():
+            entities.add_metric([name], len(detector.states))
+        yield entities
+
+
+# Общие для сервисов таймер этапов и подключение метрик к приложению
+stage = SERVICE.stage
+instrument = SERVICE.instrument
@@ -0,0 +1,201 @@
+import math
+import threading
+import time
+from array import array
+from collections import deque
+
+
+class TrendState:
+    """
+    Скользящее окно счётчиков одной сущности.
+
+    Кольцевой буфер на window периодов (последний — текущий, ещё открытый),
+    целочисленные сумма и сумма квадратов по окну и монотонная очередь для
+    максимума закрытых периодов. Закрытие периода, приращение текущего и
+    пересчёт балла — O(1) (очередь — амортизированно).
+    """
+
+    __slots__ = ("window", "counts", "head", "period", "total", "total_sq", "maxima", "is_boom")
+
+    def __init__(self, window: int, period: int):
+        self.window = window
+        self.counts = array("q", [0] * window)
+        self.head = 0            # индекс текущего периода в буфере
+        self.period = period     # номер текущего периода
+        self.total = 0
+        self.total_sq = 0
+        # (номер периода, значение) закрытых периодов с убывающими значениями
+        self.maxima = deque([(period - i, 0) for i in range(window - 1, 0, -1)])
+        self.is_boom = False
+
+    def at(self, offset: int) -> int:
+        """Значение периода offset шагов назад от текущего (0 — текущий)."""
+        return self.counts[(self.head - offset) % self.window]
+
+    def add(self, delta: int):
+        """Приращение счётчика текущего периода."""
+        current = self.counts[self.head]
+        self.counts[self.head] = current + delta
+        self.total += delta
+        self.total_sq += (current + delta) ** 2 - current ** 2
+
+    def advance(self, period: int):
+        """Закрывает периоды до period; пропущенные периоды считаются нулевыми."""
+        steps = period - self.period
+        if steps <= 0:
+            return
+        if steps >= self.window:
+            # Статус бума сохраняется: его смену фиксирует следующий пересчёт
+            is_boom = self.is_boom
+            self.__init__(self.window, period)
+            self.is_boom = is_boom
+            return
+        for _ in range(steps):
+            closed_value = self.counts[self.head]
+            while self.maxima and self.maxima[-1][1] <= closed_value:
+                self.maxima.pop()
+            self.maxima.append((self.period, closed_value))
+
+            self.period += 1
+            self.head = (self.head + 1) % self.window
+            leaving = self.counts[self.head]
+            self.total -= leaving
+            self.total_sq -= leaving * leaving
+            self.counts[self.head] = 0
+            while self.maxima[0][0] <= self.period - self.window:
+                self.maxima.popleft()
+
+    def score(self, sensitivity: float) -> tuple[bool, int]:
+        """Те же условия и порог, что и в is_boom_trend, по текущему окну."""
+        n = self.window
+        last_day = self.at(0)
+        prev_day = self.at(1)
+        max_prev = self.maxima[0][1]
+        mean_val = self.total / n
+        # Дисперсия из целых сумм без потери точности: (n*Σx² - (Σx)²) / n²
+        std_dev = math.sqrt(max(n * self.total_sq - self.total * self.total, 0)) / n
+        mean_3day = (self.at(1) + self.at(2) + self.at(3)) / 3
+        growth_rate_1day = last_day / prev_day if prev_day > 0 else 1
+        growth_rate_3day = last_day / mean_3day if mean_3day > 0 else 1
+
+        score = 0
+        if last_day > (2.5 * max_prev * sensitivity): score += 3
+        if last_day > (mean_val + 2.5 * std_dev) * sensitivity: score += 2
+        if growth_rate_1day > 1.8 and last_day > 30: score += 2
+        if growth_rate_3day > 1.6 and last_day > prev_day > self.at(2): score += 1
+        if last_day > 50: score += 1
+
+        threshold = 4 if sensitivity < 0.8 else 3 if sensitivity < 1.2 else 2
+        return score >= threshold, score
+
+    def window_counts(self) -> list[int]:
+        return [self.at(offset) for offset in range(self.window - 1, -1, -1)]
+
+
+class StreamingTrendDetector:
+    """
+    Детектор бумов по потоку счётчиков без пересылки истории.
+
+    Время делится на периоды по period_seconds (сутки, час, ...), окно —
+    window последних периодов. Обновления приходят как приращения или как
+    итог текущего периода; после каждого обновления балл сущности
+    пересчитывается за O(1), а сущности, у которых сменился статус бума,
+    копятся до следующего drain_changes(). Раз в период сущности с нулевым
+    окном (в том числе без обновлений дольше окна) удаляются: их состояние
+    не отличается от нового.
+    """
+
+    def __init__(self, window: int = 7, period_seconds: int = 86400, sensitivity: float = 1.0):
+        if window < 4:
+            raise ValueError("window должно быть не меньше 4 периодов")
+        self.window = window
+        self.period_seconds = period_seconds
+        self.sensitivity = sensitivity
+        self.states: dict[str, TrendState] = {}
+        self.changes: dict[str, bool] = {}
+        self._evicted_period = None
+        self._lock = threading.Lock()
+
+    def period_of(self, timestamp: float | None) -> int:
+        return int((time.time() if timestamp is None else timestamp) // self.period_seconds)
+
+    def _state(self, entity: str, period: int) -> TrendState:
+        state = self.states.get(entity)
+        if state is None:
+            state = self.states[entity] = TrendState(self.window, period)
+        else:
+            state.advance(period)
+        return state
+
+    def _evict_idle(self, period: int) -> int:
+        idle = []
+        for entity, state in self.states.items():
+            state.advance(period)
+            if state.period == period and state.total_sq == 0:
+                idle.append(entity)
+        for entity in idle:
+            if self.states.pop(entity).is_boom:
+                self.changes[entity] = False
+        self._evicted_period = period
+        return len(idle)
+
+    def _maybe_evict(self, period: int):
+        if self._evicted_period is None or period > self._evicted_period:
+            self._evict_idle(period)
+
+    def evict_idle(self, timestamp: float | None = None) -> int:
+        """Удаляет сущности с нулевым окном на период timestamp; возвращает их число."""
+        with self._lock:
+            return self._evict_idle(self.period_of(timestamp))
+
+    def _rescore(self, entity: str, state: TrendState) -> bool:
+        is_boom, _ = state.score(self.sensitivity)
+        if is_boom == state.is_boom:
+            return False
+        state.is_boom = is_boom
+        self.changes[entity] = is_boom
+        return True
+
+    def update(self, entity: str, count: int, timestamp: float | None = None, increment: bool = True):
+        """
+        Учитывает count в периоде timestamp (по умолчанию — сейчас): прибавляет
+        его или, при increment=False, заменяет им итог периода. Обновления
+        уже закрытых периодов игнорируются. Возвращает новый статус, если он сменился, иначе None.
+        """
+        with self._lock:
+            period = self.period_of(timestamp)
+            self._maybe_evict(period)
+            state = self._state(entity, period)
+            if period < state.period:
+                return None
+            state.add(count if increment else count - state.at(0))
+            return state.is_boom if self._rescore(entity, state) else None
+
+    def seed(self, entity: str, counts: list[int], timestamp: float | None = None):
+        """Заполняет окно историей: последний элемент counts — текущий период."""
+        with self._lock:
+            period = self.period_of(timestamp)
+            self._maybe_evict(period)
+            state = TrendState(self.window, period - len(counts) + 1)
+            for offset, count in enumerate(counts):
+                state.advance(state.period + (offset > 0))
+                state.add(count)
+            state.advance(period)
+            self.states[entity] = state
+            self._rescore(entity, state)
+            return state.is_boom
+
+    def get(self, entity: str, timestamp: float | None = None):
+        with self._lock:
+            state = self.states.get(entity)
+            if state is None:
+                return None
+            state.advance(self.period_of(timestamp))
+            is_boom, score = state.score(self.sensitivity)
+            return {"entity": entity, "counts": state.window_counts(), "score": score, "is_boom": is_boom}
+
+    def drain_changes(self) -> dict[str, bool]:
+        """Возвращает и сбрасывает сущности, сменившие статус с прошлого вызова."""
+        with self._lock:
+            changes, self.changes = self.changes, {}
+            return changes
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Модули сервиса лежат рядом с main.py, а общие — в каталоге common репозитория
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.join(os.path.dirname(SERVICE_DIR), "common")]
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from hypothesis import given, strategies as st
+from hypothesis.extra.numpy import arrays
+
+import main
+from main import WINDOW, boom_trend_batch, is_boom_trend
+
+SENSITIVITIES = [0.5, 0.79, 0.8, 1.0, 1.19, 1.2, 2.0]
+
+
+def random_rows(seed: int, n: int = 2000) -> np.ndarray:
+    """Ряды разного масштаба: нули, отрицательные, плавный рост и резкие скачки."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(-50, 200, (n, WINDOW))
+    rows[n // 4:n // 2] = rng.integers(0, 5, (n // 2 - n // 4, WINDOW))
+    rows[n // 2:3 * n // 4, -1] *= rng.integers(1, 20, n // 4)
+    rows[3 * n // 4:] = np.cumsum(rng.integers(0, 30, (n - 3 * n // 4, WINDOW)), axis=1)
+    return rows.astype(np.int64)
+
+
+def batches(dtype, elements):
+    """Матрицы N×WINDOW, включая пустую пачку и пачку из одного ряда."""
+    return arrays(dtype, st.tuples(st.integers(0, 40), st.just(WINDOW)), elements=elements)
+
+
+int_rows = batches(np.int64, st.integers(-2 ** 63, 2 ** 63 - 1))
+small_int_rows = batches(np.int64, st.integers(-5, 100))
+float_rows = batches(np.float64, st.floats(-1e9, 1e9, allow_nan=False, allow_infinity=False))
+constant_rows = st.builds(lambda n, value: np.full((n, WINDOW), value, dtype=np.int64),
+                          st.integers(0, 10), st.integers(-100, 10 ** 6))
+sensitivities = st.sampled_from(SENSITIVITIES) | st.floats(0.01, 10, allow_nan=False)
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(main.app)
+
+
+@given(rows=int_rows | small_int_rows | float_rows | constant_rows, sensitivity=sensitivities)
+def test_batch_matches_scalar(rows, sensitivity):
+    is_boom, _ = boom_trend_batch(rows, sensitivity)
+    expected = [is_boom_trend(row, sensitivity) for row in rows.tolist()]
+    assert is_boom.astype(int).tolist() == expected
+
+
+@pytest.mark.parametrize("sensitivity", [0.5, 1.0, 2.0])
+def test_endpoint_json_and_binary_match_scalar(client, sensitivity):
+    rows = random_rows(42, 300)
+    expected = [bool(is_boom_trend(row, sensitivity)) for row in rows.tolist()]
+
+    response = client.post("/detect/batch", json={"daily_counts": rows.tolist(), "sensitivity": sensitivity})
+    assert response.status_code == 200
+    assert response.json()["is_boom"] == expected
+
+    response = client.post(f"/detect/batch?sensitivity={sensitivity}", content=rows.astype("<i8").tobytes(),
+                           headers={"content-type": "application/octet-stream"})
+    assert response.status_code == 200
+    assert [bool(b) for b in response.content] == expected
+
+
+def test_batch_rejects_rows_of_other_lengths(client):
+    rows = [[1] * WINDOW, [1] * (WINDOW + 1), [1] * (WINDOW - 1)]
+    assert client.post("/detect/batch", json={"daily_counts": rows}).status_code == 422
+    with pytest.raises(ValueError):
+        boom_trend_batch(np.ones((3, WINDOW + 1), dtype=np.int64))
+
+
+def test_batch_rejects_values_outside_int64(client):
+    row = [1] * (WINDOW - 1) + [10 ** 20]
+    assert client.post("/detect/batch", json={"daily_counts": [row]}).status_code == 422
+    row[-1] = 2 ** 63 - 1
+    assert client.post("/detect/batch", json={"daily_counts": [row]}).json()["is_boom"] == [True]
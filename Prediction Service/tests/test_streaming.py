@@ -0,0 +1,55 @@
+import numpy as np
+
+from main import is_boom_trend
+from streaming import StreamingTrendDetector
+
+DAY = 86400
+
+
+def test_idle_entities_are_evicted_after_window():
+    detector = StreamingTrendDetector(window=7, period_seconds=DAY)
+    detector.update("idle", 5, timestamp=0)
+    detector.update("active", 5, timestamp=0)
+    for day in range(1, 10):
+        detector.update("active", 5, timestamp=day * DAY)
+        assert ("idle" in detector.states) == (day < 7)
+    assert "active" in detector.states
+
+
+def test_zero_window_is_evicted_on_next_period():
+    detector = StreamingTrendDetector(window=7, period_seconds=DAY)
+    detector.update("zero", 0, timestamp=0)
+    detector.update("other", 1, timestamp=DAY)
+    assert "zero" not in detector.states
+    assert detector.evict_idle(timestamp=20 * DAY) == 1
+    assert detector.states == {}
+
+
+def test_evicting_a_boom_reports_status_change():
+    detector = StreamingTrendDetector(window=7, period_seconds=DAY)
+    detector.seed("boom", [1, 1, 1, 1, 1, 1, 100], timestamp=6 * DAY)
+    assert detector.drain_changes() == {"boom": True}
+    detector.evict_idle(timestamp=20 * DAY)
+    assert detector.drain_changes() == {"boom": False}
+    assert detector.get("boom", timestamp=20 * DAY) is None
+
+
+def test_eviction_does_not_change_scores():
+    rng = np.random.default_rng(7)
+    detector = StreamingTrendDetector(window=7, period_seconds=DAY)
+    history = {}
+    for day in range(60):
+        # Сущности появляются и пропадают на несколько периодов
+        for entity in rng.choice(30, 10, replace=False):
+            count = int(rng.integers(0, 120))
+            detector.update(str(entity), count, timestamp=day * DAY)
+            history.setdefault(str(entity), {})[day] = count
+        for entity, days in history.items():
+            window = [days.get(d, 0) for d in range(day - 6, day + 1)]
+            state = detector.get(entity, timestamp=day * DAY)
+            if state is None:
+                assert not any(window)
+            else:
+                assert state["counts"] == window
+                assert state["is_boom"] == bool(is_boom_trend(window))
+        assert len(detector.states) <= 30
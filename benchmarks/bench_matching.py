@@ -0,0 +1,95 @@
+"""
+Бенчмарк Matching Service: find_best_cluster и /match при разном числе
+кластеров и размере пачки. Вместо SentenceTransformer — детерминированный
+кодировщик (эмбеддинг из хэша строки), Redis — отдельная база локального
+сервера, которая перед замером очищается.
+"""
+import hashlib
+import os
+import sys
+import types
+
+import numpy as np
+
+from harness import load_service, measure
+
+POPULATE_BATCH = 1000
+
+
+class StubEncoder:
+    """Подменяет SentenceTransformer: одинаковые строки дают одинаковые нормализованные векторы."""
+
+    dim = 1024
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_matching(args):
+    StubEncoder.dim = args.dim
+    sys.modules["sentence_transformers"] = types.SimpleNamespace(SentenceTransformer=StubEncoder)
+    os.environ.update(
+        REDIS_HOST=args.redis_host, REDIS_PORT=str(args.redis_port), REDIS_DB=str(args.redis_db),
+        MAX_CLUSTERS="0", MATCHER_BACKEND=args.matcher_backend,
+    )
+    service = load_service("Matching Service", "matching_main")
+    service.redis_client.flushdb()
+    return service
+
+
+def populate(service, target: int, created: int) -> int:
+    """Доводит число кластеров до target: каждая новая строка даёт новый кластер."""
+    while created < target:
+        names = [f"cluster-{i}" for i in range(created, min(created + POPULATE_BATCH, target))]
+        service.assign_entities(names, service.get_embeddings(names))
+        created += len(names)
+    return created
+
+
+def run(args) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    service = load_matching(args)
+    rng = np.random.default_rng(args.seed)
+    results = []
+    created = 0
+    new_names = (f"new-{i}" for i in range(10 ** 12))
+
+    with TestClient(service.app) as client:
+        service.ready.wait()
+        for clusters in args.clusters:
+            created = populate(service, clusters, created)
+            matcher = service.cluster_index.matcher
+
+            known = [f"cluster-{i}" for i in rng.integers(0, created, 256)]
+            noise = rng.standard_normal((len(known), args.dim), dtype=np.float32) * (0.3 / np.sqrt(args.dim))
+            queries = service.get_embeddings(known) + noise
+            queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+            query_iter = iter(np.resize(np.arange(len(queries)), 10 ** 6))
+            results.append(measure(
+                "matching.find_best_cluster",
+                lambda: service.find_best_cluster(queries[next(query_iter)], matcher),
+                args.iterations * 10, params={"clusters": clusters, "backend": args.matcher_backend},
+            ))
+
+            for batch in args.batch_sizes:
+                # Половина сущностей попадает в существующие кластеры, половина создаёт новые
+                def request():
+                    entities = [f"cluster-{i}" for i in rng.integers(0, created, batch - batch // 2)]
+                    entities += [next(new_names) for _ in range(batch // 2)]
+                    response = client.post("/match", json={"entities": entities})
+                    response.raise_for_status()
+
+                results.append(measure(
+                    "matching.match", request, args.iterations, items=batch,
+                    params={"clusters": clusters, "batch": batch, "backend": args.matcher_backend},
+                ))
+                print(f"  matching: {clusters} кластеров, пачка {batch} — готово")
+    return results
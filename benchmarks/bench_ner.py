@@ -0,0 +1,60 @@
+"""
+Бенчмарк NER: обработка запросов против локальной заглушки Ollama с заданной
+задержкой. Меряется накладная часть сервиса — очередь к Ollama, разбор
+ответа, пакетный и потоковый режимы — при разной конкурентности.
+"""
+import asyncio
+import os
+
+import httpx
+
+from harness import load_service, measure_async
+from mock_ollama import create_app, serve_in_thread
+
+TEXT = "Компания Яндекс и Сбербанк объявили о партнёрстве, сообщил Герман Греф. " * 4
+BATCH = 8
+
+
+async def run_async(service, ollama_url, args) -> list[dict]:
+    await service.open_http_client()
+    results = []
+    params = {"ollama_latency_ms": args.ollama_latency_ms, "ollama_concurrency": service.OLLAMA_CONCURRENCY}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=service.app), base_url="http://ner",
+                                     timeout=None) as client:
+            async def single():
+                response = await client.post("/extract-entities", json={"text": TEXT, "server_host": ollama_url})
+                response.raise_for_status()
+
+            async def batch():
+                response = await client.post("/extract-entities/batch",
+                                             json={"texts": [TEXT] * BATCH, "server_host": ollama_url})
+                response.raise_for_status()
+
+            async def stream():
+                async with client.stream("POST", "/extract-entities/stream",
+                                         json={"text": TEXT, "server_host": ollama_url}) as response:
+                    response.raise_for_status()
+                    async for _ in response.aiter_lines():
+                        pass
+
+            for concurrency in args.concurrency:
+                requests = max(args.iterations, concurrency * 4)
+                results.append(await measure_async("ner.extract", single, requests, concurrency, params=params))
+                results.append(await measure_async("ner.extract_batch", batch, max(requests // BATCH, concurrency),
+                                                   concurrency, items=BATCH, params=params))
+                results.append(await measure_async("ner.extract_stream", stream, requests, concurrency, params=params))
+                print(f"  ner: конкурентность {concurrency} — готово")
+    finally:
+        await service.close_http_client()
+    return results
+
+
+def run(args) -> list[dict]:
+    os.environ["NER_CACHE"] = "0"
+    service = load_service("NER", "ner_main")
+    ollama_url, server = serve_in_thread(create_app(args.ollama_latency_ms, args.token_delay_ms))
+    try:
+        return asyncio.run(run_async(service, ollama_url, args))
+    finally:
+        server.should_exit = True
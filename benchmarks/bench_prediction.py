@@ -0,0 +1,41 @@
+"""
+Бенчмарк Prediction Service: is_boom_trend, пакетная и потоковая детекция и /detect.
+"""
+import numpy as np
+
+from harness import load_service, measure
+
+
+def run(args) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    service = load_service("Prediction Service", "prediction_main")
+    rng = np.random.default_rng(args.seed)
+    series = rng.integers(0, 200, (args.rows, service.WINDOW)).astype(np.int64)
+    rows = series.tolist()
+    row_iter = iter(np.resize(np.arange(len(rows)), 10 ** 7))
+    results = [
+        measure("prediction.is_boom_trend", lambda: service.is_boom_trend(rows[next(row_iter)]),
+                args.iterations * 100),
+        measure("prediction.boom_trend_batch", lambda: service.boom_trend_batch(series),
+                args.iterations, items=len(series), params={"rows": len(series)}),
+    ]
+
+    detector = service.StreamingTrendDetector()
+    entities = [f"entity-{i}" for i in range(1000)]
+    counts = rng.integers(0, 20, 10 ** 6).tolist()
+    update_iter = iter(range(10 ** 7))
+
+    def update():
+        i = next(update_iter)
+        detector.update(entities[i % len(entities)], counts[i % len(counts)])
+
+    results.append(measure("prediction.stream_update", update, args.iterations * 100, params={"entities": len(entities)}))
+
+    with TestClient(service.app) as client:
+        def detect():
+            client.post("/detect", json={"daily_counts": rows[next(row_iter)]}).raise_for_status()
+
+        results.append(measure("prediction.detect", detect, args.iterations))
+    print("  prediction — готово")
+    return results
@@ -0,0 +1,130 @@
+"""
+Общие части бенчмарков: загрузка сервисов, замеры и сравнение с базовой линией.
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Сколько вызовов повторяется под tracemalloc для оценки пикового потребления памяти:
+# трассировка замедляет код, поэтому задержки меряются отдельным проходом без неё
+MEMORY_ITERATIONS = 5
+
+
+def load_service(directory: str, module_name: str):
+    """
+    Импортирует main.py сервиса под уникальным именем: у всех сервисов
+    модуль называется main, а соседние модули ищутся в каталоге сервиса.
+    Одноимённые модули другого сервиса (например, metrics) выгружаются,
+    чтобы сервис импортировал свои.
+    """
+    path = os.path.join(ROOT, directory)
+    for entry in (path, os.path.join(ROOT, "common")):
+        if entry in sys.path:
+            sys.path.remove(entry)
+        sys.path.insert(0, entry)
+    for file_name in os.listdir(path):
+        name, ext = os.path.splitext(file_name)
+        module = sys.modules.get(name)
+        if ext == ".py" and module is not None and os.path.dirname(getattr(module, "__file__", "") or "") != path:
+            del sys.modules[name]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(name: str, params: dict, latencies: list[float], elapsed: float, items: int, peak_bytes: int) -> dict:
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "name": name,
+        "params": params,
+        "iterations": len(latencies),
+        "throughput": len(latencies) * items / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "peak_memory_mb": peak_bytes / 2 ** 20,
+    }
+
+
+def measure(name: str, fn, iterations: int, items: int = 1, warmup: int = 3, params: dict | None = None) -> dict:
+    """Последовательно вызывает fn iterations раз; throughput — items в секунду."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    for _ in range(min(iterations, MEMORY_ITERATIONS)):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, params or {}, latencies, elapsed, items, peak)
+
+
+async def measure_async(name: str, fn, requests: int, concurrency: int, items: int = 1,
+                        params: dict | None = None) -> dict:
+    """Выполняет requests корутин fn(), держа в полёте не больше concurrency одновременно."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            await fn()
+            latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one() for _ in range(min(concurrency, requests))))
+    latencies.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    measured = list(latencies)
+
+    tracemalloc.start()
+    await asyncio.gather(*(one() for _ in range(min(requests, concurrency * MEMORY_ITERATIONS))))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(name, {"concurrency": concurrency, **(params or {})}, measured, elapsed, items, peak)
+
+
+def result_id(result: dict) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """
+    Сравнивает с базовой линией по совпадающим замерам. Регрессия — падение
+    throughput или рост p95 больше чем на tolerance (доля).
+    """
+    previous = {result_id(result): result for result in baseline}
+    regressions = []
+    print(f"\n{'benchmark':<60} {'throughput':>12} {'p95, ms':>10}")
+    for result in results:
+        key = result_id(result)
+        old = previous.get(key)
+        if old is None:
+            print(f"{key:<60} {'новый':>12} {'':>10}")
+            continue
+        throughput_change = result["throughput"] / old["throughput"] - 1
+        p95_change = result["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0.0
+        regressed = throughput_change < -tolerance or p95_change > tolerance
+        mark = "❌" if regressed else "✅"
+        print(f"{key:<60} {throughput_change:>+11.1%} {p95_change:>+9.1%} {mark}")
+        if regressed:
+            regressions.append(key)
+    return regressions
@@ -0,0 +1,74 @@
+"""
+Локальная заглушка Ollama для бенчмарков и ручных проверок NER.
+
+Отвечает на /api/generate фиксированным JSON с сущностями после задержки
+--latency-ms; в потоковом режиме отдаёт ответ кусками с паузой
+--token-delay-ms между ними, как настоящая генерация.
+
+Пример:
+    python mock_ollama.py --port 8081 --latency-ms 500
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def make_response(entities: int) -> str:
+    return json.dumps({"entities": [{"name": f"Сущность {i}", "type": "ORG"} for i in range(entities)]},
+                      ensure_ascii=False)
+
+
+def create_app(latency_ms: float = 200, token_delay_ms: float = 5, entities: int = 5, tokens: int = 40) -> FastAPI:
+    app = FastAPI()
+    answer = make_response(entities)
+    step = max(len(answer) // tokens, 1)
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        if not payload.get("stream", True):
+            return {"model": payload.get("model"), "response": answer, "done": True}
+
+        async def lines():
+            for start in range(0, len(answer), step):
+                yield json.dumps({"response": answer[start:start + step], "done": False}, ensure_ascii=False) + "\n"
+                await asyncio.sleep(token_delay_ms / 1000)
+            yield json.dumps({"response": "", "done": True}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+
+def serve_in_thread(app: FastAPI) -> tuple[str, uvicorn.Server]:
+    """Запускает приложение на свободном порту в фоновом потоке; возвращает адрес и сервер для остановки."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{sock.getsockname()[1]}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    parser.add_argument("--entities", type=int, default=5)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.token_delay_ms, args.entities), host="0.0.0.0", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Воспроизводимые бенчмарки сервисов без внешних зависимостей.
+
+Наборы:
+    matching   — find_best_cluster и /match (заглушка кодировщика, локальный Redis)
+    prediction — is_boom_trend, пакетная и потоковая детекция, /detect
+    ner        — /extract-entities против локальной заглушки Ollama
+
+Для каждого замера — throughput, p50/p95/p99 задержки и пиковая память
+(tracemalloc). Результаты сохраняются в JSON; с --baseline сравниваются
+с прошлым прогоном, и при регрессии больше --tolerance код выхода 1.
+
+Набор matching очищает базу --redis-db: запускайте его на отдельной базе
+или отдельном сервере Redis.
+
+Пример:
+    python run.py --suites prediction,ner --output results.json
+    python run.py --baseline baseline.json --tolerance 0.15
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+
+import numpy as np
+
+from harness import compare
+
+
+def int_list(value: str) -> list[int]:
+    return [int(x) for x in value.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default="matching,prediction,ner")
+    parser.add_argument("--output", default="results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    # matching
+    parser.add_argument("--clusters", type=int_list, default=[1000, 10000, 50000])
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 16, 64])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--matcher-backend", default="exact")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--redis-db", type=int, default=15)
+    # prediction
+    parser.add_argument("--rows", type=int, default=100_000)
+    # ner
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32])
+    parser.add_argument("--ollama-latency-ms", type=float, default=200)
+    parser.add_argument("--token-delay-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    results = []
+    for suite in suites:
+        print(f"▶ {suite}")
+        if suite == "matching":
+            import bench_matching as bench
+        elif suite == "prediction":
+            import bench_prediction as bench
+        elif suite == "ner":
+            import bench_ner as bench
+        else:
+            parser.error(f"Неизвестный набор: {suite}")
+        results.extend(bench.run(args))
+
+    for result in results:
+        params = ", ".join(f"{key}={value}" for key, value in result["params"].items())
+        print(f"{result['name']:<28} {params:<45} {result['throughput']:>12,.1f}/s  "
+              f"p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms  "
+              f"{result['peak_memory_mb']:8.1f} MB")
+
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Регрессии: {len(regressions)}")
+            sys.exit(1)
+        print("✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
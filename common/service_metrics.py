@@ -0,0 +1,87 @@
+"""
+Общая часть метрик сервисов: гистограммы времени запросов и этапов,
+подключение к FastAPI (GET /metrics, профилировщик по ?profile=1).
+Свои счётчики и коллекторы каждый сервис объявляет в своём metrics.py.
+
+В образ файл попадает из дополнительного контекста сборки common
+(docker-compose), при локальном запуске каталог common нужен в PYTHONPATH.
+"""
+import os
+import time
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Histogram, generate_latest
+from prometheus_client.core import REGISTRY
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # профилировщик необязателен
+    Profiler = None
+
+
+class Timer:
+    """Контекстный менеджер: время блока попадает в гистограмму."""
+
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class ServiceMetrics:
+    """
+    Гистограммы <prefix>_http_request_seconds (метки method, route, status)
+    и <prefix>_stage_seconds (метка stage) одного сервиса.
+    """
+
+    def __init__(self, prefix: str, stage_help: str, buckets):
+        self.request_seconds = Histogram(f"{prefix}_http_request_seconds", "Время обработки HTTP-запроса",
+                                         ["method", "route", "status"], buckets=buckets)
+        self.stage_seconds = Histogram(f"{prefix}_stage_seconds", stage_help, ["stage"], buckets=buckets)
+
+    def stage(self, name: str) -> Timer:
+        """Время блока with stage(name) попадает в гистограмму этапа name."""
+        return Timer(self.stage_seconds.labels(name))
+
+    def instrument(self, app, *collectors):
+        """
+        Регистрирует коллекторы сервиса, пишет время каждого запроса и
+        добавляет GET /metrics. При PROFILING=1 и установленном pyinstrument
+        запрос с ?profile=1 возвращает HTML-профиль вместо ответа. Профиль
+        снимается с потока цикла событий: синхронные обработчики и пул
+        потоков видны в нём только как ожидание.
+        """
+        for collector in collectors:
+            REGISTRY.register(collector)
+        request_seconds = self.request_seconds
+        profiling = os.getenv("PROFILING", "0") == "1" and Profiler is not None
+
+        @app.middleware("http")
+        async def record_request(request: Request, call_next):
+            if profiling and request.query_params.get("profile") == "1":
+                profiler = Profiler(async_mode="enabled")
+                profiler.start()
+                response = await call_next(request)
+                # Потоковый ответ профилируется целиком, до последней строки
+                async for _ in response.body_iterator:
+                    pass
+                profiler.stop()
+                return HTMLResponse(profiler.output_html())
+
+            started = time.perf_counter()
+            response = await call_next(request)
+            route = request.scope.get("route")
+            request_seconds.labels(request.method, route.path if route else "unmatched",
+                                   str(response.status_code)).observe(time.perf_counter() - started)
+            return response
+
+        @app.get("/metrics", include_in_schema=False)
+        def metrics():
+            return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)